@@ -0,0 +1,29 @@
+from bluesky.plans import count
+
+# The HDF5 plugins send their datums as datum_page documents; every
+# datum_kwargs column has to be as long as datum_id, one entry per datum.
+
+assert cam_diag6_hdf5.connected
+
+pages = []
+
+
+def _keep_pages(name, doc):
+    if name == 'datum_page':
+        pages.append(doc)
+
+
+uid, = RE(count([cam_diag6_hdf5], num=3), _keep_pages)
+assert pages
+point_numbers = {}
+for page in pages:
+    for key, column in page['datum_kwargs'].items():
+        assert len(column) == len(page['datum_id']), (key, page)
+    point_numbers.setdefault(page['resource'], []).extend(
+        page['datum_kwargs']['point_number'])
+# image and timestamp resources each number the 3 points once
+for numbers in point_numbers.values():
+    assert numbers == [0, 1, 2], numbers
+
+# and they read back
+assert len(db[uid].table(fill=True)) == 3
@@ -0,0 +1,56 @@
+import bluesky.plan_stubs as bps
+from csx1.analysis.baseline import full_baseline
+
+# With sd.delta = True every run of a plan that opens several (ct_dark_all,
+# ...) records a baseline, not only the first one.
+
+
+def two_runs():
+    for _ in range(2):
+        yield from bps.open_run()
+        yield from bps.close_run()
+
+
+saved = sd.delta, sd.slow_baseline
+sd.delta, sd.slow_baseline = True, []
+sd.reset_reference()
+try:
+    uids = RE(two_runs()) + RE(two_runs())
+finally:
+    sd.delta, sd.slow_baseline = saved
+
+assert len(uids) == 4
+headers = [db[uid] for uid in uids]
+# the first run is the reference, the other three are deltas against it
+assert 'baseline_reference' not in headers[0].start
+assert 'baseline' in headers[0].stream_names
+for h in headers[1:]:
+    assert h.start['baseline_reference'] == uids[0], h.start
+assert sd.reference['uid'] == uids[0]
+assert sd.reference['runs'] == 3, sd.reference['runs']
+
+# and every one of them reads back the whole baseline at open and close
+columns = set(full_baseline(db, headers[0]).columns)
+for h in headers:
+    table = full_baseline(db, h)
+    assert len(table) == 2, (h.start['uid'], len(table))
+    assert set(table.columns) == columns
+
+# The slow tier is also decided per run: with slow_every = 2 the runs of
+# two two-run plans read it in the 1st and 4th run, and the 2nd and 3rd
+# point at the 1st.
+slow_device = sd.baseline[-1]
+saved = sd.baseline[:], sd.slow_baseline, sd.slow_every, sd.slow_reference
+sd.baseline.remove(slow_device)
+sd.slow_baseline, sd.slow_every, sd.slow_reference = [slow_device], 2, None
+try:
+    uids = RE(two_runs()) + RE(two_runs())
+finally:
+    sd.baseline[:], sd.slow_baseline, sd.slow_every, sd.slow_reference = saved
+
+headers = [db[uid] for uid in uids]
+slow_refs = [h.start.get('baseline_slow_reference') for h in headers]
+assert slow_refs == [None, uids[0], uids[0], None], slow_refs
+slow_columns = set(db[uids[0]].table('baseline').columns) - {'time'}
+for h in headers:
+    assert slow_columns <= set(full_baseline(db, h).columns), h.start['uid']
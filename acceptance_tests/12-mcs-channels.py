@@ -0,0 +1,19 @@
+# The FastCCD's MCS only builds (and connects) the waveforms of its active
+# channels, 1-6; read_attrs, describe() and read() do not touch the others.
+
+active = {f'wfrm_{i}' for i in range(1, 7)}
+
+
+def built():
+    return {walk.dotted_name for walk in fccd.mcs.wfrm.walk_signals()}
+
+
+assert fccd.mcs.active_channels == list(range(1, 7))
+assert fccd.mcs.read_attrs == ['wfrm'] + [f'wfrm.wfrm_{i}' for i in range(1, 7)]
+assert built() <= active, built()
+
+desc = fccd.mcs.describe()
+assert {key for key in desc if 'wfrm' in key} == {
+    getattr(fccd.mcs.wfrm, attr).name for attr in active}, list(desc)
+fccd.mcs.describe_configuration()
+assert built() == active, built()
@@ -0,0 +1,139 @@
+"""Time a full launch of the collection profile.
+
+Runs the profile headless in a fresh IPython with startup profiling turned on
+(see ``startup/csx1/profiling.py``), builds every device in the registry so
+their construction times are recorded too, and writes the JSON report::
+
+    python benchmarks/startup.py -o startup.json
+
+By default the devices use ophyd's ``dummy`` control layer and the profile
+leaves out kafka, olog and the beamline databroker (``CSX_OFFLINE=1``), so
+nothing talks to the beamline and the numbers measure our own code and
+imports.  With ``--sim`` the profile runs against the simulated beamline IOC
+instead (``CSX_SIMULATION=1``, see ``startup/csx1/sim``), which includes
+connecting.
+Compare against an earlier report to catch regressions before a beamtime::
+
+    python benchmarks/startup.py -o new.json --baseline old.json
+
+exits with status 1 if the total, any startup file or any device got slower
+by more than ``--tolerance`` (and ``--min-delta`` seconds).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.dirname(HERE)
+
+# Run inside the profile once all the startup files are done.
+BUILD_ALL = """
+from csx1.profiling import profiler
+failed = {}
+for name in registry:
+    try:
+        registry.materialize(name)
+    except Exception as err:
+        failed[name] = repr(err)
+profiler.track_devices(registry.build_times)
+profiler.write()
+if failed:
+    print('Devices that failed to build:', failed)
+"""
+
+
+def run_profile(output, *, control_layer='dummy', connect_timeout=1,
+                simulation=False):
+    env = dict(os.environ)
+    env['CSX_PROFILE_STARTUP'] = os.path.abspath(output)
+    env['CSX_CONNECT_TIMEOUT'] = str(connect_timeout)
+    # never kafka, olog or the beamline databroker from a benchmark
+    env['CSX_OFFLINE'] = '1'
+    if simulation:
+        env['CSX_SIMULATION'] = '1'
+    elif control_layer:
+        env['OPHYD_CONTROL_LAYER'] = control_layer
+    cmd = [sys.executable, '-m', 'IPython', '--no-banner',
+           f'--profile-dir={PROFILE_DIR}', '-c', BUILD_ALL]
+    subprocess.run(cmd, env=env, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+
+def compare(report, baseline, tolerance, min_delta):
+    "Lines describing everything that got slower than allowed."
+    def check(label, new, old):
+        if new - old > max(old * tolerance, min_delta):
+            regressions.append(f'{label:<40} {old:8.3f} s -> {new:8.3f} s')
+
+    regressions = []
+    check('total', report['total_wall'], baseline['total_wall'])
+    for group in ('files', 'sections'):
+        for name, entry in report[group].items():
+            if name in baseline[group]:
+                check(name, entry['wall'], baseline[group][name]['wall'])
+    for name, seconds in report['devices'].items():
+        if name in baseline['devices']:
+            check(f'device {name}', seconds, baseline['devices'][name])
+    return regressions
+
+
+def summarize(report, top=15):
+    print(f"total {report['total_wall']:.2f} s, "
+          f"rss {report['rss'] / 2**20:.0f} MiB")
+    for group in ('files', 'sections'):
+        for name, entry in report[group].items():
+            print(f"  {name:<30} {entry['wall']:8.3f} s "
+                  f"{entry['rss_delta'] / 2**20:+8.1f} MiB")
+    print('slowest packages (self time of their imports):')
+    for name, seconds in list(report['packages'].items())[:top]:
+        print(f'  {name:<30} {seconds:8.3f} s')
+    print('slowest devices:')
+    devices = sorted(report['devices'].items(), key=lambda kv: -kv[1])
+    for name, seconds in devices[:top]:
+        print(f'  {name:<30} {seconds:8.3f} s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output',
+                        help='where to write the JSON report '
+                             '(default: a temporary file)')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown (default 0.2)')
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help='ignore slowdowns smaller than this many seconds')
+    parser.add_argument('--control-layer', default='dummy',
+                        help="ophyd control layer, '' for the site default")
+    parser.add_argument('--sim', action='store_true',
+                        help='run against the simulated beamline IOC')
+    parser.add_argument('--connect-timeout', type=float, default=1,
+                        help='CSX_CONNECT_TIMEOUT for the profile')
+    args = parser.parse_args(argv)
+
+    output = args.output or tempfile.mkstemp(suffix='.json')[1]
+    report = run_profile(output, control_layer=args.control_layer,
+                         connect_timeout=args.connect_timeout,
+                         simulation=args.sim)
+    summarize(report)
+    print(f'report written to {output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print('startup got slower:')
+            print('\n'.join(regressions))
+            return 1
+        print('no regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,29 @@
+import os
+from IPython import get_ipython
+from csx1.profiling import start_from_environment
+# No-op unless CSX_PROFILE_STARTUP is set, see csx1/profiling.py
+startup_profiler = start_from_environment(get_ipython(), '00-nsls2-tools.py')
+
+# CSX_SIMULATION=1 runs everything against a local soft IOC instead of the
+# beamline, see csx1/sim/__init__.py. This has to happen before any PV exists.
+from csx1 import sim
+simulation = sim.simulation_mode()
+if simulation == 'local':
+    sim_ioc = sim.start_ioc(
+        metadata='/nsls2/data/csx/shared/config/pv-metadata-cache.json')
+    sim.use_ioc(f'127.0.0.1:{sim.DEFAULT_PORT}')
+elif simulation:
+    sim.use_ioc(simulation)
+
 from ophyd.signal import EpicsSignalBase
 EpicsSignalBase.set_defaults(timeout=10, connection_timeout=10)  # new style
 # EpicsSignalBase.set_default_timeout(timeout=10, connection_timeout=10)  # old style
 
+# Times every PV from creation to connection for the report in 95-connect.py.
+from csx1.devices.connection import ConnectionTimer
+connection_timer = ConnectionTimer()
+connection_timer.install()
+
 
 
 import appdirs
@@ -12,19 +34,40 @@ from pathlib import Path
 from csx1.analysis.callbacks import BECwithTicks
 
 ip = get_ipython()
-nslsii.configure_base(ip.user_ns, 'csx', publish_documents_with_kafka=True, bec=False)
-nslsii.configure_olog(ip.user_ns)
+offline = sim.offline_mode()
+with startup_profiler.section('configure_base'):  # databroker, kafka, olog
+    if offline:
+        # no kafka, olog or beamline databroker off the beamline
+        from databroker import Broker
+        nslsii.configure_base(ip.user_ns, Broker.named('temp'), bec=False)
+    else:
+        nslsii.configure_base(ip.user_ns, 'csx', publish_documents_with_kafka=True, bec=False)
+        nslsii.configure_olog(ip.user_ns)
 
 # Commenting out the DAMA-suggested location
 # (~/.local/share/bluesky/runengine-metadata), as the BL staff prefers a
 # separate location.
 # runengine_metadata_dir = appdirs.user_data_dir(appname="bluesky") / Path("runengine-metadata")
 runengine_metadata_dir = os.path.expanduser("/nsls2/data/csx/shared/config/RE-metadata")
+if offline:
+    runengine_metadata_dir = appdirs.user_data_dir(appname="bluesky") / Path("runengine-metadata-sim")
 RE.md = PersistentDict(runengine_metadata_dir)
 
+# describe() of EPICS signals is answered from this cache and checked against
+# the live PVs in the background. Set CSX_PV_CACHE=0 to turn it off.
+if os.environ.get('CSX_PV_CACHE', '1') != '0':
+    from csx1.devices.pvcache import PVMetadataCache
+    pv_metadata_cache = PVMetadataCache(
+        os.path.join(os.path.dirname(runengine_metadata_dir), 'pv-metadata-cache.json'))
+    pv_metadata_cache.install()
+
 bec = BECwithTicks()
 peaks = bec.peaks  # just as alias for less typing
 RE.subscribe(bec)
 
 
 from csx1.startup import *
+
+if startup_profiler.enabled:
+    startup_profiler.track_devices(registry.build_times)
+    startup_profiler.end('00-nsls2-tools.py')
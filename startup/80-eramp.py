@@ -5,6 +5,7 @@ import bluesky.preprocessors as bpp
 from collections import ChainMap
 
 from ophyd import StatusBase
+from csx1.analysis.callbacks import BECwithTicks, NormalizedChannels, ratio
 import builtins
 input = builtins.input
 
@@ -21,6 +22,7 @@ def change_epu_flt_link(new_target, epu):
 
 
 def simple_norm(doc):
+    # Old per-document version, see eramp_norm below for live use.
     try:
         doc.data['norm_intensity'] = doc.data['sclr_ch4']/doc.data['sclr_ch3']
     except KeyError:
@@ -28,6 +30,12 @@ def simple_norm(doc):
     return doc
 
 
+# sclr_ch4 / sclr_ch3 computed over whole event pages and plotted live:
+#   RE(E_ramp([sclr], 700, 720, 0.1), eramp_norm)
+eramp_norm = NormalizedChannels({'norm_intensity': ratio('sclr_ch4', 'sclr_ch3')},
+                                BECwithTicks())
+
+
 def _run_E_ramp(dets, start, stop, velocity, deadband, *,
                 streamname='primary', md=None, epu, pgm, specs):
     if md is None:
@@ -7,9 +7,24 @@ from ophyd.device import (
 )
 from ophyd.status import StatusBase
 from ophyd import EpicsSignal
+from ophyd.areadetector.filestore_mixins import resource_factory
+from collections import deque
+import datetime
+import itertools
+import numpy as np
+import os
+import uuid
 
 
 class ScalerMCA(Device):
+    """The MCA buffers of the softglue scaler.
+
+    While staged, ``read()`` appends the MCA arrays to an HDF5 file written
+    by this process (one row per point and channel) and the event only
+    carries datum references to them; see
+    ``csx1.analysis.handlers.SoftglueHDF5Handler`` for reading them back.
+    Set ``write_to_file = False`` to put the arrays in the events instead.
+    """
     _default_read_attrs = ("channels", "current_channel")
     _default_configuration_attrs = ("nuse", "prescale")
 
@@ -31,11 +46,75 @@ class ScalerMCA(Device):
         eraseall = Co(EpicsSignal, "EraseAll", string=True)
         erasestart = Co(EpicsSignal, "EraseStart", string=True)
 
+    write_to_file = True
+    write_path_template = "/nsls2/data/csx/legacy/softglue_data/%Y/%m/%d"
+    root = "/nsls2/data/csx/legacy"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._asset_docs_cache = deque()
+        self._h5 = None
+        self._datum_factory = None
+        self._point_counter = None
+
     def stage(self):
         staged_cmpts = super().stage()
         self.eraseall.put("Erase")
+        if self.write_to_file:
+            self._open_file()
         return staged_cmpts
 
+    def unstage(self):
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+        self._asset_docs_cache.clear()
+        return super().unstage()
+
+    def _open_file(self):
+        import h5py
+
+        path = datetime.datetime.now().strftime(self.write_path_template)
+        os.makedirs(path, exist_ok=True)
+        fn = os.path.join(path, f"{uuid.uuid4()}.h5")
+        self._h5 = h5py.File(fn, "w")
+        self._point_counter = itertools.count()
+        resource, self._datum_factory = resource_factory(
+            spec="CSX_SOFTGLUE_HDF5",
+            root=self.root,
+            resource_path=os.path.relpath(fn, self.root),
+            resource_kwargs={},
+            path_semantics="posix",
+        )
+        self._asset_docs_cache.append(("resource", resource))
+
+    def _write_point(self, channel, point, value):
+        "Store one MCA array as row `point` of /<channel>/data."
+        value = np.asarray(value)
+        if channel not in self._h5:
+            group = self._h5.create_group(channel)
+            group.create_dataset("data", shape=(0, len(value)), maxshape=(None, None),
+                                 dtype=value.dtype, chunks=(1, max(len(value), 1)))
+            group.create_dataset("length", shape=(0,), maxshape=(None,), dtype="i8")
+        group = self._h5[channel]
+        data, length = group["data"], group["length"]
+        data.resize((point + 1, max(data.shape[1], len(value))))
+        length.resize((point + 1,))
+        data[point, :len(value)] = value
+        length[point] = len(value)
+
+    def collect_asset_docs(self):
+        items = list(self._asset_docs_cache)
+        self._asset_docs_cache.clear()
+        yield from items
+
+    def describe(self):
+        res = super().describe()
+        if self._h5 is not None:
+            for attr in self.channels.read_attrs:
+                res[getattr(self.channels, attr).name]["external"] = "FILESTORE:"
+        return res
+
     def stop(self):
         self.stopall.put("Stop")
 
@@ -45,8 +124,18 @@ class ScalerMCA(Device):
         return StatusBase(done=True, success=True)
 
     def read(self):
-        # TODO handle file writing and document generation
-        return super().read()
+        res = super().read()
+        if self._h5 is None:
+            return res
+        point = next(self._point_counter)
+        for attr in self.channels.read_attrs:
+            reading = res[getattr(self.channels, attr).name]
+            self._write_point(attr, point, reading["value"])
+            datum = self._datum_factory({"channel": attr, "point": point})
+            self._asset_docs_cache.append(("datum", datum))
+            reading["value"] = datum["datum_id"]
+        self._h5.flush()
+        return res
 
 
 class FixedScalerCH(ScalerCH):
@@ -63,13 +152,29 @@ class Scaler(Device):
     def __init__(self, *args, mode="counting", **kwargs):
         super().__init__(*args, **kwargs)
         self.set_mode(mode)
+        # channel number -> name in the IOC, kept up to date by monitors on
+        # the .NMx fields so that staging does not have to read them
+        self._chnames = {}
+        for chan in self.cnts.channels.component_names:
+            getattr(self.cnts.channels, chan).chname.subscribe(self._chname_changed)
+
+    def _chname_changed(self, value, obj, **kwargs):
+        self._chnames[int(obj.parent.attr_name[len("chan"):])] = value
 
     def match_names(self, N=20):
-        self.cnts.match_names()
-        for j in range(1, N + 1):
-            mca_ch = getattr(self.mcas.channels, f"mca{j:02d}")
-            ct_ch = getattr(self.cnts.channels, f"chan{j:02d}")
-            mca_ch.name = ct_ch.chname.get()
+        """Name the count (and first N MCA) signals after the IOC channel names.
+
+        Uses the names cached from the monitors; only channels whose name
+        has not arrived yet are read.
+        """
+        for chan in self.cnts.channels.component_names:
+            j = int(chan[len("chan"):])
+            ct_ch = getattr(self.cnts.channels, chan)
+            if j not in self._chnames:
+                self._chnames[j] = ct_ch.chname.get()
+            ct_ch.s.name = self._chnames[j]
+            if j <= N:
+                getattr(self.mcas.channels, f"mca{j:02d}").name = self._chnames[j]
 
     # TODO put a soft signal around this so we can stage it
     def set_mode(self, mode):
@@ -102,6 +207,10 @@ class Scaler(Device):
         self.match_names()
         return staged_cmpts
 
+    def collect_asset_docs(self):
+        if self._mode == "flying":
+            yield from self.mcas.collect_asset_docs()
+
     def unstage(self):
         if self._mode == "counting":
             unstaged_cmpts = self.cnts.unstage()
@@ -0,0 +1,20 @@
+## Wait for every device built during startup in one go, with a single
+## deadline, rather than one connection_timeout per dead IOC later on.
+## Lazy devices (cameras, fccd, ...) are not built here; they connect on first use,
+## unless CSX_CONNECT_ALL=1, which builds every registered device and creates
+## all of their PVs in one batch.
+from csx1.devices.connection import connect_all, find_devices, report_connections
+
+_connect_everything = os.environ.get('CSX_CONNECT_ALL', '0') == '1'
+with startup_profiler.section('connect_all'):
+    connection_report = connect_all(find_devices(get_ipython().user_ns, registry,
+                                                 build=_connect_everything),
+                                    timeout=float(os.environ.get('CSX_CONNECT_TIMEOUT', 10)),
+                                    all_signals=_connect_everything,
+                                    timer=connection_timer)
+# the full table (per-IOC latencies) goes to the log
+report_connections(connection_report)
+
+# Subscribe to the baseline signals in the background so the first run does
+# not have to read them all.
+sd.start_monitoring()
@@ -0,0 +1,53 @@
+"""Reading back baselines recorded with ``sd.delta = True`` or a slow tier.
+
+Delta runs only hold the baseline fields that changed since their reference
+run (``start['baseline_reference']``), which holds the full baseline.  Runs
+that skipped ``sd.slow_baseline`` name the last run that read it as
+``start['baseline_slow_reference']``.  See :mod:`csx1.devices.baseline`.
+"""
+import pandas as pd
+
+
+def full_baseline(db, header):
+    """The complete baseline table of a run, delta-encoded or not.
+
+    Parameters
+    ----------
+    db : databroker.Broker
+    header : Header or str
+        The run, or its uid / scan id.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per baseline event (open and close), as ``header.table('baseline')``
+        would give for a run that recorded the full baseline with both tiers.
+    """
+    if not hasattr(header, 'start'):
+        header = db[header]
+    table = header.table('baseline')
+    reference_uid = header.start.get('baseline_reference')
+    if reference_uid is not None:
+        table = _apply_delta(db, table, reference_uid)
+    slow_uid = header.start.get('baseline_slow_reference')
+    if slow_uid is not None:
+        slow = full_baseline(db, slow_uid).iloc[-1]
+        for column in slow.index:
+            if column not in table.columns and column != 'time':
+                table[column] = [slow[column]] * len(table)
+    return table
+
+
+def _apply_delta(db, table, reference_uid):
+    reference = db[reference_uid].table('baseline').iloc[-1]
+    rows = []
+    # A run in which nothing moved records no baseline at all.
+    for _, delta in (table.iterrows() if len(table) else [(None, None)] * 2):
+        row = reference.copy()
+        if delta is not None:
+            row.update(delta.dropna())
+        rows.append(row)
+    full = pd.DataFrame(rows).reset_index(drop=True)
+    full.index = full.index + 1  # seq_num, as header.table() numbers rows
+    full.index.name = 'seq_num'
+    return full
@@ -1,4 +1,7 @@
+import numpy as np
+from bluesky.callbacks.core import CallbackBase
 from bluesky.callbacks.best_effort import BestEffortCallback
+from event_model import pack_event_page
 
 
 class BECwithTicks(BestEffortCallback):
@@ -13,3 +16,145 @@ class BECwithTicks(BestEffortCallback):
             scatter.ax.tick_params(labelbottom=True, labelleft=True)
         for grid in self._live_grids.get(doc["uid"], {}).values():
             grid.ax.tick_params(labelbottom=True, labelleft=True)
+
+
+def _as_array(value):
+    return np.asarray(value, dtype=float)
+
+
+class Derived:
+    """A normalized channel computed from other fields of the same run.
+
+    Parameters
+    ----------
+    func : callable
+        Gets a dict of field name -> numpy array (one entry per event) for
+        the fields in ``inputs`` and returns the derived array.
+    inputs : list of str
+        Fields it needs.  A field that is not in the stream being
+        normalized (e.g. ``ring_curr`` in the baseline or a monitor stream)
+        is taken as the latest value seen in the other streams.
+    """
+    def __init__(self, func, inputs):
+        self.func = func
+        self.inputs = list(inputs)
+
+    def __repr__(self):
+        return f'Derived({self.func.__name__}, {self.inputs})'
+
+
+def ratio(signal, monitor, *, dark=0.0, monitor_dark=0.0):
+    "``(signal - dark) / (monitor - monitor_dark)``"
+    def ratio(data):
+        return (data[signal] - dark) / (data[monitor] - monitor_dark)
+    return Derived(ratio, [signal, monitor])
+
+
+def dark_subtracted(signal, dark):
+    "``signal - dark``; ``dark`` is a number or the name of another field."
+    if isinstance(dark, str):
+        return Derived(lambda data: data[signal] - data[dark], [signal, dark])
+    return Derived(lambda data: data[signal] - dark, [signal])
+
+
+def ring_normalized(signal, *, current='ring_curr', reference=400.0):
+    "``signal`` scaled to a ``reference`` ring current (mA)."
+    def ring_normalized(data):
+        return data[signal] * reference / data[current]
+    return Derived(ring_normalized, [signal, current])
+
+
+class NormalizedChannels(CallbackBase):
+    """Adds normalized channels to a document stream on its way to ``targets``.
+
+    Subscribe it to the RunEngine instead of (or next to) the callbacks it
+    feeds::
+
+        norm = NormalizedChannels({'norm_intensity': ratio('sclr_ch4', 'sclr_ch3')},
+                                  BECwithTicks())
+        RE(E_ramp(...), norm)
+
+    The documents of ``stream_name`` are passed on with the derived fields
+    added (and hinted, so the best-effort callback plots them); everything
+    is computed with numpy over whole event pages, single events go through
+    as pages of one.  The documents the RunEngine emits are not modified.
+    Derived channels whose inputs are missing from a run are skipped with
+    one message per run instead of failing on every event.
+
+    Parameters
+    ----------
+    channels : dict
+        Name of the derived field -> :class:`Derived` (see :func:`ratio`,
+        :func:`dark_subtracted`, :func:`ring_normalized`).
+    *targets : callables
+        Receive ``(name, doc)`` with the derived fields added.
+    stream_name : str, optional
+    """
+    def __init__(self, channels, *targets, stream_name='primary'):
+        super().__init__()
+        self.channels = dict(channels)
+        self.targets = list(targets)
+        self.stream_name = stream_name
+        self._active = {}
+        self._latest = {}
+
+    def __call__(self, name, doc):
+        if name == 'start':
+            self._active.clear()
+            self._latest.clear()
+        elif name == 'descriptor':
+            doc = self.descriptor(doc)
+        elif name == 'event':
+            doc = self.event_page(pack_event_page(doc))
+            name = 'event_page'
+        elif name == 'event_page':
+            doc = self.event_page(doc)
+        for target in self.targets:
+            target(name, doc)
+
+    def descriptor(self, doc):
+        if doc.get('name', 'primary') != self.stream_name:
+            return doc
+        available = set(doc['data_keys']) | set(self._latest)
+        active = {}
+        for name, derived in self.channels.items():
+            missing = [key for key in derived.inputs if key not in available]
+            if missing:
+                print(f'Not computing {name}: no {", ".join(missing)} in this run.')
+            else:
+                active[name] = derived
+        self._active[doc['uid']] = active
+        if not active:
+            return doc
+        data_keys = dict(doc['data_keys'])
+        for name in active:
+            data_keys[name] = {'source': 'derived', 'dtype': 'number', 'shape': []}
+        hints = dict(doc.get('hints', {}))
+        hints['normalized'] = {'fields': list(active)}
+        object_keys = dict(doc.get('object_keys', {}))
+        object_keys['normalized'] = list(active)
+        return dict(doc, data_keys=data_keys, hints=hints, object_keys=object_keys)
+
+    def event_page(self, doc):
+        active = self._active.get(doc['descriptor'])
+        if active is None:
+            # another stream: remember the latest scalars for broadcasting
+            for key, values in doc['data'].items():
+                if len(values) and np.ndim(values[-1]) == 0:
+                    self._latest[key] = values[-1]
+            return doc
+        if not active:
+            return doc
+        n = len(doc['time'])
+        columns = {}
+        derived = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name, channel in active.items():
+                for key in channel.inputs:
+                    if key not in columns:
+                        columns[key] = (_as_array(doc['data'][key]) if key in doc['data']
+                                        else np.full(n, self._latest[key], dtype=float))
+                derived[name] = np.broadcast_to(channel.func(columns), (n,)).tolist()
+        timestamps = dict(doc['timestamps'])
+        timestamps.update((name, doc['time']) for name in derived)
+        return dict(doc, data=dict(doc['data'], **derived), timestamps=timestamps)
@@ -0,0 +1,185 @@
+"""All the frames of an area detector run as one lazy dask array.
+
+``fccd`` writes ``num_images`` frames per point, and a run can span several
+files (``ProductionCamStandard.resume()`` starts a new one after a pause).
+`run_frames` stitches every datum of the run into a single
+``(frames, rows, cols)`` dask array; nothing is read until it is computed,
+and then one block (one point) at a time, in parallel.  The files stay open
+until the ``with`` block ends::
+
+    with run_frames(db, -1) as frames:
+        mean = frames.mean(axis=0).compute()
+        roi = frames[:, 100:200, 300:400].sum(axis=(1, 2)).compute()
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from .handlers import REPROCESSING_HANDLERS
+
+
+class BlockCache:
+    """Loaded blocks, least recently used dropped first past `max_bytes`.
+
+    Shared by the dask tasks of a run so that computing several reductions
+    of the same frames does not read them again.
+    """
+    def __init__(self, max_bytes=2e9):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                return self._blocks[key]
+        block = load()
+        with self._lock:
+            if key not in self._blocks and block.nbytes <= self.max_bytes:
+                self._blocks[key] = block
+                self.nbytes += block.nbytes
+                while self.nbytes > self.max_bytes:
+                    _, old = self._blocks.popitem(last=False)
+                    self.nbytes -= old.nbytes
+        return block
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.nbytes = 0
+
+
+class _RunAssets:
+    "Resources and datums of a run, with one handler per resource."
+    def __init__(self, db, header):
+        self.resources = {}
+        self.datums = {}
+        self._handlers = {}
+        self._lock = threading.Lock()
+        # the Broker's handlers for anything we do not have a faster one for
+        self._handler_reg = dict(getattr(db.reg, 'handler_reg', {}) or {})
+        self._handler_reg.update(REPROCESSING_HANDLERS)
+        for name, doc in header.documents(fill=False):
+            if name == 'resource':
+                self.resources[doc['uid']] = doc
+            elif name == 'datum':
+                self.datums[doc['datum_id']] = (doc['resource'], doc['datum_kwargs'])
+            elif name == 'datum_page':
+                kwargs = doc['datum_kwargs']
+                for i, datum_id in enumerate(doc['datum_id']):
+                    self.datums[datum_id] = (doc['resource'],
+                                             {k: v[i] for k, v in kwargs.items()})
+
+    def handler(self, resource_uid):
+        with self._lock:
+            if resource_uid not in self._handlers:
+                res = self.resources[resource_uid]
+                cls = self._handler_reg[res['spec']]
+                fn = os.path.join(res.get('root', ''), res['resource_path'])
+                self._handlers[resource_uid] = cls(fn, **res['resource_kwargs'])
+            return self._handlers[resource_uid]
+
+    def load(self, datum_id):
+        resource_uid, kwargs = self.datums[datum_id]
+        return np.asarray(self.handler(resource_uid)(**kwargs))
+
+    def nframes(self, datum_id):
+        "Frames the datum holds without reading them, None if unknown."
+        resource_uid, kwargs = self.datums[datum_id]
+        handler = self.handler(resource_uid)
+        if not hasattr(handler, 'frame_range'):
+            return None
+        start, stop = handler.frame_range(**kwargs)
+        return stop - start
+
+    def close(self):
+        for h in self._handlers.values():
+            h.close()
+        self._handlers.clear()
+
+
+@contextmanager
+def run_frames(db, header, field='fccd_image', stream_name='primary', *,
+               cache=None):
+    """All frames of `field` in a run, as a lazy dask array.
+
+    A context manager: the handlers (and their files) are closed when the
+    block ends, so compute what is needed inside it.
+
+    Parameters
+    ----------
+    db : databroker.Broker
+    header : Header or str
+        The run, or its uid / scan id.
+    field : str, optional
+        Image field in the stream.
+    stream_name : str, optional
+    cache : BlockCache, optional
+        Where loaded blocks are kept; a new 2 GB one by default.  Pass
+        ``BlockCache(0)`` to not keep anything.
+
+    Yields
+    ------
+    dask.array.Array
+        Shape ``(frames, rows, cols)``, one chunk per point, in event
+        order.  Each chunk is as long as its point really is, e.g. an
+        aborted last point can be shorter.
+    """
+    if not hasattr(header, 'start'):
+        header = db[header]
+    own_cache = cache is None
+    if own_cache:
+        cache = BlockCache()
+    assets = _RunAssets(db, header)
+    try:
+        yield _frames(assets, header, field, stream_name, cache)
+    finally:
+        if own_cache:
+            cache.clear()
+        assets.close()
+
+
+def _frames(assets, header, field, stream_name, cache):
+    import dask
+    import dask.array as da
+
+    descriptors = [d for d in header.descriptors
+                   if d.get('name', 'primary') == stream_name]
+    if not descriptors:
+        raise ValueError(f'The run has no {stream_name!r} stream.')
+    data_key = descriptors[0]['data_keys'][field]
+    datum_ids = list(header.table(stream_name, fields=[field], fill=False)[field])
+    if not datum_ids:
+        raise ValueError(f'No {field!r} frames in the {stream_name!r} stream.')
+
+    def load(datum_id):
+        arr = cache.get(datum_id, lambda: assets.load(datum_id))
+        # a single frame per point comes without the frame axis
+        return arr[np.newaxis] if arr.ndim == 2 else arr
+
+    # the data key shape is not trustworthy for every detector, so look at
+    # one block for the frame shape and dtype
+    first = load(datum_ids[0])
+    frame_shape, dtype = first.shape[1:], first.dtype
+    if data_key.get('shape') and tuple(data_key['shape'][-2:]) != frame_shape:
+        print(f'{field}: the files hold {frame_shape} frames, not the '
+              f'{tuple(data_key["shape"][-2:])} in the descriptor.')
+
+    blocks = []
+    for datum_id in datum_ids:
+        n = assets.nframes(datum_id)
+        if n is None:
+            # a handler that cannot tell without reading
+            n = len(load(datum_id))
+        if not n:
+            continue
+        blocks.append(da.from_delayed(dask.delayed(load, pure=True)(datum_id),
+                                      shape=(n,) + frame_shape, dtype=dtype))
+    if not blocks:
+        raise ValueError(f'The {field!r} files of the run hold no frames.')
+    return da.concatenate(blocks, axis=0)
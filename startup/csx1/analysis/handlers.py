@@ -0,0 +1,223 @@
+"""Handlers for the external files written by CSX devices.
+
+Register them with the Broker once::
+
+    register_handlers(db)
+
+Only the CSX specs are registered.  The ``AD_HDF5`` files keep the upstream
+handlers in the Broker (old runs included); the memory-mapped handlers for
+them here are for reprocessing, see `REPROCESSING_HANDLERS` and
+:mod:`csx1.analysis.frames`.
+"""
+import numpy as np
+
+
+class SoftglueHDF5Handler:
+    """Reads the MCA arrays that ``ScalerMCA`` writes while flying.
+
+    Each channel is a group holding ``data`` (one row per point, padded to
+    the longest array) and ``length`` (the real length of each row).
+    """
+    specs = {'CSX_SOFTGLUE_HDF5'}
+
+    def __init__(self, filename):
+        import h5py
+        self._file = h5py.File(filename, 'r')
+
+    def __call__(self, channel, point):
+        group = self._file[channel]
+        return group['data'][point, :group['length'][point]]
+
+    def close(self):
+        self._file.close()
+
+
+class _DetectorFile:
+    """An area detector HDF5 file, opened once and shared by its handlers.
+
+    The image and the timestamp resources of a run point at the same file,
+    so the handlers of both get the same open file (and dataset handle)
+    through `open` and give it back with `release`.
+
+    Frames come from a memory map of the file when the dataset is stored
+    contiguously and uncompressed, so slicing them does not read anything
+    until the data is used.  Chunked datasets (e.g. the SWMR files of the
+    FCCD) are read with one ``read_direct`` per request, which lets HDF5
+    copy whole chunks straight into the returned array.
+    """
+    dataset = '/entry/data/data'
+    attributes = '/entry/instrument/NDAttributes'
+    _open = {}
+
+    @classmethod
+    def open(cls, filename):
+        entry = cls._open.get(filename)
+        if entry is None:
+            entry = cls._open[filename] = [cls(filename), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self):
+        entry = self._open.get(self.filename)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._open[self.filename]
+            self._file.close()
+
+    def __init__(self, filename):
+        import h5py
+        self.filename = filename
+        self._file = h5py.File(filename, 'r', libver='latest', swmr=True)
+        self._dset = self._file[self.dataset]
+        self._memmap = self._map()
+
+    def _map(self):
+        dset = self._dset
+        if dset.chunks is not None or dset.compression is not None:
+            return None
+        offset = dset.id.get_offset()
+        if offset is None:
+            # nothing written yet
+            return None
+        return np.memmap(self.filename, dtype=dset.dtype, mode='r',
+                         offset=offset, shape=dset.shape)
+
+    def __len__(self):
+        "Frames in the file so far."
+        if self._memmap is not None:
+            return len(self._memmap)
+        self._dset.refresh()
+        return self._dset.shape[0]
+
+    def frames(self, start, stop):
+        if self._memmap is not None:
+            return self._memmap[start:stop]
+        dset = self._dset
+        dset.refresh()
+        start, stop, _ = slice(start, stop).indices(dset.shape[0])
+        out = np.empty((max(stop - start, 0),) + dset.shape[1:], dtype=dset.dtype)
+        if len(out):
+            dset.read_direct(out, np.s_[start:stop])
+        return out
+
+    def timestamps(self, start, stop):
+        "EPICS epoch seconds of frames ``start:stop``."
+        attrs = self._file[self.attributes]
+        sec = attrs['NDArrayEpicsTSSec'][start:stop]
+        nsec = attrs['NDArrayEpicsTSnSec'][start:stop]
+        return sec + nsec * 1e-9
+
+
+class ADHDF5FramesHandler:
+    """Frames of the area detector files written with the ``AD_HDF5`` spec.
+
+    Reads the FCCD (HDF5PluginWithFileStore) and the Prosilica and AXIS
+    (HDF5PluginWithFileStorePlain) stacks.  Datums address a point; for
+    reprocessing, `frames` and `timestamps` take any range of frames::
+
+        h = ADHDF5FramesHandler(filename, frame_per_point=100)
+        darks = h.frames(0, 2000)
+
+    Unlike the upstream handler it returns numpy arrays (memory maps where
+    it can) rather than dask arrays, which is why it is not registered for
+    ``AD_HDF5`` in the Broker.
+    """
+    specs = {'AD_HDF5'}
+
+    def __init__(self, filename, frame_per_point=1):
+        self._file = _DetectorFile.open(filename)
+        self._fpp = frame_per_point
+
+    def _point(self, point_number):
+        start = point_number * self._fpp
+        return start, start + self._fpp
+
+    def __call__(self, point_number):
+        return self.frames(*self._point(point_number))
+
+    def frame_range(self, **datum_kwargs):
+        "The frames (start, stop) a datum gets, as far as the file has them."
+        start, stop = self._point(datum_kwargs['point_number'])
+        return start, max(start, min(stop, len(self._file)))
+
+    def frames(self, start, stop):
+        return self._file.frames(start, stop)
+
+    def timestamps(self, start, stop):
+        return self._file.timestamps(start, stop)
+
+    def get_file_list(self, datum_kwargs_gen):
+        return [self._file.filename]
+
+    def close(self):
+        self._file.release()
+
+
+class ADHDF5TimestampHandler(ADHDF5FramesHandler):
+    """Timestamps of a point, for the ``AD_HDF5_DET_TS`` resources.
+
+    Squeezed like the upstream handler, so one frame per point gives a
+    scalar (``time_stamp`` is described with ``shape=[]``).
+    """
+    specs = {'AD_HDF5_DET_TS'}
+
+    def __call__(self, point_number):
+        return np.squeeze(self.timestamps(*self._point(point_number)))
+
+
+class FramesHDF5Handler(ADHDF5FramesHandler):
+    """Frames ``start:stop`` of an area detector HDF5 file.
+
+    Used by ContinuousAcquisitionTrigger, where a run writes one file and
+    each point addresses its frames by index.
+    """
+    specs = {'CSX_AD_HDF5_FRAMES'}
+
+    def __call__(self, start, stop, **kwargs):
+        return self.frames(start, stop)
+
+    def frame_range(self, start, stop, **kwargs):
+        return start, max(start, min(stop, len(self._file)))
+
+
+class FramesTimestampHandler(ADHDF5FramesHandler):
+    "Detector timestamps (EPICS epoch seconds) of frames ``start:stop``."
+    specs = {'CSX_AD_HDF5_FRAMES_TS'}
+
+    def __call__(self, start, stop, **kwargs):
+        return self.timestamps(start, stop)
+
+
+class VDSHandler(FramesHDF5Handler):
+    """The VDS index of a run (see :mod:`csx1.analysis.vds`).
+
+    The run declares the index as a resource but makes no datums for it,
+    so the Broker never fills anything from it; this is for code that
+    looks the resource up, e.g. ``handler(0, 500)`` for the first 500
+    frames of the run across all of its files.
+    """
+    specs = {'CSX_AD_HDF5_VDS'}
+
+    def __init__(self, filename, dataset=_DetectorFile.dataset):
+        if dataset != _DetectorFile.dataset:
+            raise ValueError(f'Only {_DetectorFile.dataset} is supported, '
+                             f'not {dataset}.')
+        super().__init__(filename)
+
+
+HANDLERS = {'CSX_SOFTGLUE_HDF5': SoftglueHDF5Handler,
+            'CSX_AD_HDF5_FRAMES': FramesHDF5Handler,
+            'CSX_AD_HDF5_FRAMES_TS': FramesTimestampHandler,
+            'CSX_AD_HDF5_VDS': VDSHandler}
+
+# for reading the frames back in bulk, not registered with the Broker
+REPROCESSING_HANDLERS = {**HANDLERS,
+                         'AD_HDF5': ADHDF5FramesHandler,
+                         'AD_HDF5_DET_TS': ADHDF5TimestampHandler}
+
+
+def register_handlers(db):
+    for spec, handler in HANDLERS.items():
+        db.reg.register_handler(spec, handler, overwrite=True)
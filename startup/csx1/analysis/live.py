@@ -0,0 +1,205 @@
+"""Read area detector frames while the HDF5 plugin is still writing them.
+
+``HDF5PluginSWMR`` (the FCCD) writes its files in SWMR mode, so they can be
+opened read-only and followed during the run.  ``LiveFrames`` watches the
+plugin's progress signal, reads the frames that arrived since the last look
+in one block and hands them to the consumers::
+
+    roi = ROISums({'speckle': (slice(100, 200), slice(300, 400))})
+    live = LiveFrames(fccd.hdf5, subtract_dark(dark, roi))
+    RE(live_frames_wrapper(count([fccd], 100), live))
+
+A consumer is any callable ``consumer(frames, start)``: ``frames`` is a
+``(n, rows, cols)`` array of the new frames and ``start`` the index of the
+first of them in the file.  The array is shared between the consumers of a
+block and should not be modified in place.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+from bluesky.preprocessors import finalize_wrapper
+
+
+logger = logging.getLogger(__name__)
+
+
+class LiveFrames:
+    """Follow the SWMR file of an HDF5 plugin and feed the new frames on.
+
+    Parameters
+    ----------
+    plugin : HDF5PluginSWMR
+        Staged (or about to be) plugin; the file read is the one it
+        generated the resource for, so a new file after pause/resume is
+        picked up too.
+    *consumers : callable
+        Called as ``consumer(frames, start)`` from the reader thread.
+    dataset : str, optional
+        Where the frames are in the file.
+    poll : float, optional
+        Also look for new frames this often (seconds) when the progress
+        signal is quiet, e.g. the SWMR flushes lag the captured counter.
+    """
+    dataset = '/entry/data/data'
+
+    def __init__(self, plugin, *consumers, dataset=None, poll=1):
+        self.plugin = plugin
+        self.consumers = list(consumers)
+        if dataset is not None:
+            self.dataset = dataset
+        self.poll = poll
+        self.frames_read = 0
+        self.error = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._signal = None
+        self._cid = None
+        self._stale_fn = None
+
+    @property
+    def progress_signal(self):
+        "swmr_cb_counter counts SWMR flushes, num_captured is the fallback."
+        return getattr(self.plugin, 'swmr_cb_counter', self.plugin.num_captured)
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('LiveFrames is already running')
+        self.frames_read = 0
+        self.error = None
+        self._stopping = False
+        self._wake.clear()
+        # _fn outlives unstage, so until the plugin opens a file for this
+        # run (it usually stages after this) it names the previous run's;
+        # _resource_uid is only set while a file of the current run is open
+        if getattr(self.plugin, '_resource_uid', None) is None:
+            self._stale_fn = getattr(self.plugin, '_fn', None)
+        else:
+            self._stale_fn = None
+        self._signal = self.progress_signal
+        self._cid = self._signal.subscribe(self._progress, run=False)
+        self._thread = threading.Thread(target=self._run, name='live-frames',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        "Read whatever is left in the file and stop following it."
+        if self._thread is None:
+            return
+        self._signal.unsubscribe(self._cid)
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('LiveFrames did not finish reading %s in %s s',
+                           self.plugin.name, timeout)
+        self._thread = None
+        if self.error is not None:
+            print(f'Live frame processing stopped early: {self.error!r}')
+
+    def _progress(self, **kwargs):
+        self._wake.set()
+
+    def _filename(self):
+        # _fn is only set once the plugin is staged
+        fn = getattr(self.plugin, '_fn', None)
+        return None if fn == self._stale_fn else fn
+
+    def _run(self):
+        import h5py
+
+        fn = f = dset = None
+        start = 0
+        try:
+            while True:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                stopping = self._stopping
+                if self._filename() != fn:
+                    # new file (new stage, or resume after a pause)
+                    if f is not None:
+                        start = self._read_new(dset, start)
+                        f.close()
+                    fn, f, dset, start = self._filename(), None, None, 0
+                if f is None and fn is not None and os.path.exists(fn):
+                    try:
+                        f = h5py.File(fn, 'r', libver='latest', swmr=True)
+                        dset = f[self.dataset]
+                    except (OSError, KeyError):
+                        # not created or not switched to SWMR yet
+                        f = dset = None
+                if dset is not None:
+                    start = self._read_new(dset, start)
+                if stopping:
+                    break
+        except Exception as err:
+            self.error = err
+            logger.exception('Reading frames from %s failed', fn)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _read_new(self, dset, start):
+        "Hand the frames past `start` to the consumers; return the new start."
+        dset.refresh()
+        stop = dset.shape[0]
+        if stop <= start:
+            return start
+        frames = np.empty((stop - start,) + dset.shape[1:], dtype=dset.dtype)
+        dset.read_direct(frames, np.s_[start:stop])
+        for consumer in self.consumers:
+            consumer(frames, start)
+        self.frames_read += stop - start
+        return stop
+
+
+def live_frames_wrapper(plan, live):
+    "Run `plan` with `live` following the detector file from start to end."
+    def inner():
+        live.start()
+        return (yield from plan)
+
+    def cleanup():
+        live.stop()
+        yield from ()
+
+    return (yield from finalize_wrapper(inner(), cleanup()))
+
+
+def subtract_dark(dark, *consumers):
+    """Consumer that passes ``frames - dark`` on to `consumers`.
+
+    The subtraction is done once per block, in float32.
+    """
+    dark = np.asarray(dark, dtype=np.float32)
+
+    def consumer(frames, start):
+        corrected = np.subtract(frames, dark, dtype=np.float32)
+        for c in consumers:
+            c(corrected, start)
+    return consumer
+
+
+class ROISums:
+    """Consumer that sums regions of interest of every frame.
+
+    Parameters
+    ----------
+    rois : dict
+        Name -> ``(row_slice, col_slice)``.
+
+    The sums so far are in ``sums[name]`` (one value per frame, in file
+    order).
+    """
+    def __init__(self, rois):
+        self.rois = dict(rois)
+        self.sums = {name: [] for name in self.rois}
+
+    def __call__(self, frames, start):
+        for name, (rows, cols) in self.rois.items():
+            self.sums[name].extend(frames[:, rows, cols].sum(axis=(1, 2)))
+
+    def as_arrays(self):
+        return {name: np.asarray(v) for name, v in self.sums.items()}
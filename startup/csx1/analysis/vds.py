@@ -0,0 +1,129 @@
+"""One HDF5 file per run that holds all of its detector frames.
+
+Pausing a run toggles the capture of the HDF5 plugin, which then carries on
+in a new file, so an FCCD run can be spread over several files (one
+resource each).  ``HDF5PluginWithFileStore`` writes a virtual dataset (VDS)
+index next to them once it has unstaged, in a background thread
+(``wait_vds()`` waits for it).  The index is declared as a
+``CSX_AD_HDF5_VDS`` resource of the run with no datums, i.e. it only says
+where the index is (``VDSHandler`` reads it), and its ``/entry/data/data``
+maps the frames of all the files, in order, onto one dataset::
+
+    with open_run_vds(db, -1) as f:
+        frames = f['/entry/data/data']
+
+`build_run_vds` writes the index after the fact for runs that do not have
+one.
+"""
+import os
+import uuid
+
+VDS_SPEC = 'CSX_AD_HDF5_VDS'
+DATASET = '/entry/data/data'
+
+
+def build_vds(filenames, out, dataset=DATASET):
+    """Write `out` with a virtual `dataset` that concatenates the files.
+
+    The sources are referred to by their name relative to `out`, so the
+    index keeps working when the directory is moved as a whole.
+
+    Returns
+    -------
+    int
+        The number of frames mapped.
+    """
+    import h5py
+
+    sources = []
+    for fn in filenames:
+        with h5py.File(fn, 'r', libver='latest', swmr=True) as f:
+            dset = f[dataset]
+            sources.append((fn, dset.shape, dset.dtype))
+    if not sources:
+        raise ValueError('No files to index.')
+    frame_shape, dtype = sources[0][1][1:], sources[0][2]
+    total = sum(shape[0] for _, shape, _ in sources)
+    layout = h5py.VirtualLayout(shape=(total,) + frame_shape, dtype=dtype)
+    start = 0
+    outdir = os.path.dirname(os.path.abspath(out))
+    for fn, shape, _ in sources:
+        if shape[1:] != frame_shape:
+            raise ValueError(f'{fn} holds {shape[1:]} frames, not {frame_shape}.')
+        rel = os.path.relpath(os.path.abspath(fn), outdir)
+        layout[start:start + shape[0]] = h5py.VirtualSource(rel, dataset, shape=shape)
+        start += shape[0]
+    group, name = dataset.rsplit('/', 1)
+    # written under another name first so that nobody opens half an index
+    tmp = f'{out}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with h5py.File(tmp, 'w', libver='latest') as f:
+            g = f.require_group(group or '/')
+            g.create_virtual_dataset(name, layout, fillvalue=0)
+            g[name].attrs['sources'] = [os.path.basename(fn) for fn, _, _ in sources]
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return total
+
+
+def _path(resource):
+    return os.path.join(resource.get('root', ''), resource['resource_path'])
+
+
+def _resources(header):
+    return [doc for name, doc in header.documents(fill=False) if name == 'resource']
+
+
+def run_vds_path(db, header):
+    "The VDS index of a run, or None if it did not write one."
+    if not hasattr(header, 'start'):
+        header = db[header]
+    for res in _resources(header):
+        if res['spec'] == VDS_SPEC:
+            return _path(res)
+    return None
+
+
+def open_run_vds(db, header):
+    "Open the VDS index of a run (read only), building it if missing."
+    import h5py
+
+    fn = run_vds_path(db, header)
+    if fn is None or not os.path.exists(fn):
+        fn = build_run_vds(db, header)
+    return h5py.File(fn, 'r')
+
+
+def build_run_vds(db, header, out=None, spec='AD_HDF5'):
+    """Write the VDS index of a run from its `spec` resources.
+
+    Parameters
+    ----------
+    out : str, optional
+        Where to write it; by default the path the run declared, else next
+        to the first file as ``<name>_vds.h5``.
+
+    Returns
+    -------
+    str
+        The path of the index.
+    """
+    if not hasattr(header, 'start'):
+        header = db[header]
+    files = []
+    for res in _resources(header):
+        if res['spec'] == spec and _path(res) not in files:
+            files.append(_path(res))
+    if not files:
+        raise ValueError(f'The run has no {spec} resources.')
+    if out is None:
+        out = run_vds_path(db, header) or vds_name(files[0])
+    build_vds(files, out)
+    return out
+
+
+def vds_name(first_file):
+    "Name of the index of a run whose first file is `first_file`."
+    return os.path.splitext(first_file)[0] + '_vds.h5'
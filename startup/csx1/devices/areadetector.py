@@ -13,8 +13,13 @@ from ophyd import AreaDetector
 from pathlib import PurePath
 import time as ttime
 import itertools
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
 
 from ophyd.sim import NullStatus
+from ophyd.status import SubscriptionStatus, wait as status_wait
 
 from .devices import DelayGenerator
 from .scaler import StruckSIS3820MCS
@@ -22,11 +27,35 @@ from .scaler import StruckSIS3820MCS
 import numpy as np
 
 from .stats_plugin import StatsPluginCSX
+from ..analysis.vds import VDS_SPEC, build_vds, vds_name
+
+logger = logging.getLogger(__name__)
 
 
 DEFAULT_TIMEOUT = 10  # Seconds
 
 
+def wait_for_value(signal, value, timeout=DEFAULT_TIMEOUT):
+    """Block until `signal` reads `value`, from its monitor (no polling).
+
+    Enum signals can be waited on by name, e.g. ``'Idle'``.  Raises
+    TimeoutError after `timeout` seconds; returns the seconds waited.
+    """
+    def reached(value_, obj, **kwargs):
+        # no CA calls in here, this runs in the monitor callback
+        if isinstance(value, str) and not isinstance(value_, str) and obj.enum_strs:
+            value_ = obj.enum_strs[int(value_)]
+        return value_ == value
+
+    t0 = ttime.monotonic()
+    try:
+        SubscriptionStatus(signal, reached, timeout=timeout).wait()
+    except TimeoutError as err:
+        raise TimeoutError(f'{signal.name} did not get to {value!r} '
+                           f'within {timeout} s') from err
+    return ttime.monotonic() - t0
+
+
 class ExternalFileReference(Signal):
     """
     A pure software signal where a Device can stash a datum_id.
@@ -49,12 +78,15 @@ class ExternalFileReference(Signal):
 
 class ContinuousAcquisitionTrigger(BlueskyInterface):
     """
-    TODO: Not currently operational. It saves `cam.num_images` images in a single file.
-          The intended behavior is to save one file across all images in a BlueskyRun.
-
-    This trigger mixin class records images when it is triggered.
-
-    It expects the detector to *already* be acquiring, continously.
+    This trigger mixin class records images from a detector that is
+    *already* acquiring, continuously.
+
+    The file plugin is put in Stream mode at stage and captures for the
+    whole run, so there is one file per run.  Its callbacks are only
+    enabled while a trigger is collecting: each trigger lets ``num_images``
+    frames through and gets a datum for exactly those frames (by frame
+    index, so a frame that slips in before the plugin is disabled again
+    does not shift later points).  The file is closed at unstage.
     """
     def __init__(self, *args, plugin_name=None, image_name=None, **kwargs):
         if plugin_name is None:
@@ -63,66 +95,179 @@ class ContinuousAcquisitionTrigger(BlueskyInterface):
         self._plugin = getattr(self, plugin_name)
         if image_name is None:
             image_name = '_'.join([self.name, 'image'])
-        self._plugin.stage_sigs[self._plugin.auto_save] = 'No'
         self.cam.stage_sigs[self.cam.image_mode] = 'Continuous'
-        self._plugin.stage_sigs[self._plugin.file_write_mode] = 'Capture'
+        # (string keys, like the ones the FileStore mixins set)
+        self._plugin.stage_sigs['file_write_mode'] = 'Stream'
+        self._plugin.stage_sigs['num_capture'] = 0
+        # No frames reach the file until a trigger asks for them; this has to
+        # happen before capture starts.
+        self._plugin.stage_sigs['enable'] = 'Disable'
+        self._plugin.stage_sigs.move_to_end('enable', last=False)
+        # datums address frames by index, see csx1.analysis.handlers
+        self._plugin.filestore_spec = 'CSX_AD_HDF5_FRAMES'
+        if hasattr(self._plugin, 'ts_spec'):
+            self._plugin.ts_spec = 'CSX_AD_HDF5_FRAMES_TS'
         self._image_name = image_name
         self._status = None
+        self._frames = None
+        self._trigger_time = None
         self._num_captured_signal = self._plugin.num_captured
         self._num_captured_signal.subscribe(self._num_captured_changed)
-        self._save_started = False
 
     def stage(self):
         if self.cam.acquire.get() != 1:
              try:
                 self.cam.acquire.put(1)
-                print("Not currently acquiring...starting continuous acquisition.")
-                ttime.sleep(1)
-             except:
+             except Exception as err:
                  raise RuntimeError("The ContinuousAcuqisitionTrigger expects "
                                     "the detector to already be acquiring."
-                                    "I was unable to fix it, please restart the ui.") #new line, DO
-             
+                                    "I was unable to fix it, please restart the ui.") from err #new line, DO
+             print("Not currently acquiring...starting continuous acquisition.")
+             # a TimeoutError here means the put went through but the
+             # detector never started, let that through as it is
+             wait_for_value(self.cam.acquire, 1)
+
         # Stage the detector
         super().stage()
 
+    def unstage(self):
+        # Stopping the capture is what writes out and closes the file.
+        status_wait(self._plugin.capture.set(0), timeout=DEFAULT_TIMEOUT)
+        super().unstage()
+
     def trigger(self):
         "Trigger one acquisition."
         if not self._staged:
             raise RuntimeError("This detector is not ready to trigger."
                                "Call the stage() method before triggering.")
-        self._save_started = False
+        start = self._num_captured_signal.get()
+        self._frames = (start, start + self.cam.num_images.get())
+        self._trigger_time = ttime.time()
         self._status = DeviceStatus(self)
-        self._desired_number_of_images = self.cam.num_images.get()
-        self._plugin.num_capture.put(self._desired_number_of_images)
-        self.generate_datum(self._image_name, ttime.time())
-        # self.proc.reset_filter.put(1) TODO: Not sure if this is needed
-        self._plugin.capture.put(1)
+        self._plugin.enable.put('Enable')
         return self._status
 
     def _num_captured_changed(self, value=None, old_value=None, **kwargs):
         "This is called when the `num_captured` signal changes."
-        if self._status is None:
-            # This means that we captured data before or in between triggers.
-            # This leads to dropped frames so we don't want this to occur.
-            raise RuntimeError("Dropped frames detected. There is a race condition between the HDF plugin and the trigger method.")
-        # If we have captured the desired number of images, write the file.
-        # TODO: we don't want to write the file here, we want to write the file in `unstage()`
-        if value == self._desired_number_of_images:
-            try:
-                self._plugin.write_file.put(1)
-            except Exception as e:
-                print(e)
-                raise
-            self._save_started = True
-        if value == 0 and self._save_started:
-            self._status._finished()
-            self._status = None
-            self._save_started = False
+        if self._status is None or value < self._frames[1]:
+            return
+        self._plugin.enable.put('Disable')
+        status, self._status = self._status, None
+        start, stop = self._frames
+        self.generate_datum(self._image_name, self._trigger_time,
+                            {'start': start, 'stop': stop})
+        status._finished()
+
+
+class KindSchema:
+    """Which fields of a detector are read, hinted or configuration.
+
+    Declared once (usually on the class, see KindSchemaMixin) and applied in
+    one pass when the device is built, instead of setting kinds attribute by
+    attribute on every instance.  Dotted names reach into plugins and cams.
+
+    Parameters
+    ----------
+    read_attrs : list of str, optional
+        Replaces the device's read_attrs.
+    extra_read_attrs : list of str, optional
+        Added to the device's read_attrs.
+    sub_read_attrs : dict, optional
+        Component name -> read_attrs of that component.
+    kinds : dict, optional
+        Dotted component name -> kind ('hinted', 'normal', 'config',
+        'omitted').
+    configuration_attrs : list of str, optional
+        Added to the device's configuration_attrs.
+
+    Schemas add up: ``stats_schema() + roi_schema()``.
+    """
+    def __init__(self, *, read_attrs=None, extra_read_attrs=(),
+                 sub_read_attrs=None, kinds=None, configuration_attrs=()):
+        self.read_attrs = None if read_attrs is None else list(read_attrs)
+        self.extra_read_attrs = list(extra_read_attrs)
+        self.sub_read_attrs = dict(sub_read_attrs or {})
+        self.kinds = dict(kinds or {})
+        self.configuration_attrs = list(configuration_attrs)
+
+    def __add__(self, other):
+        def merged(a, b):
+            return a + [x for x in b if x not in a]
+
+        return KindSchema(
+            read_attrs=self.read_attrs if other.read_attrs is None else other.read_attrs,
+            extra_read_attrs=merged(self.extra_read_attrs, other.extra_read_attrs),
+            sub_read_attrs={**self.sub_read_attrs, **other.sub_read_attrs},
+            kinds={**self.kinds, **other.kinds},
+            configuration_attrs=merged(self.configuration_attrs,
+                                       other.configuration_attrs))
+
+    def __bool__(self):
+        return bool(self.read_attrs is not None or self.extra_read_attrs
+                    or self.sub_read_attrs or self.kinds
+                    or self.configuration_attrs)
+
+    def __repr__(self):
+        return (f'KindSchema(read_attrs={self.read_attrs!r}, '
+                f'extra_read_attrs={self.extra_read_attrs!r}, '
+                f'sub_read_attrs={self.sub_read_attrs!r}, '
+                f'kinds={self.kinds!r}, '
+                f'configuration_attrs={self.configuration_attrs!r})')
+
+    def apply(self, device):
+        if self.read_attrs is not None:
+            device.read_attrs = list(self.read_attrs)
+        if self.extra_read_attrs:
+            current = list(device.read_attrs)
+            device.read_attrs = current + [attr for attr in self.extra_read_attrs
+                                           if attr not in current]
+        for attr, read_attrs in self.sub_read_attrs.items():
+            getattr(device, attr).read_attrs = list(read_attrs)
+        for attr, kind in self.kinds.items():
+            getattr(device, attr).kind = kind
+        if self.configuration_attrs:
+            current = list(device.configuration_attrs)
+            device.configuration_attrs = current + [
+                attr for attr in self.configuration_attrs if attr not in current]
+
+
+def stats_schema(n=5):
+    "Read stats1..n with only their total, hinted."
+    stats = [f'stats{i}' for i in range(1, n + 1)]
+    return KindSchema(extra_read_attrs=stats,
+                      sub_read_attrs={k: ['total'] for k in stats},
+                      kinds={f'{k}.total': 'hinted' for k in stats})
+
+
+ROI_PARAMS = ['.min_xyz', '.min_xyz.min_y', '.min_xyz.min_x',
+              '.size', '.size.y', '.size.x', '.name_']
+
+
+def roi_schema(n=4):
+    "Record the position, size and name of roi1..n as configuration."
+    rois = [f'roi{i}' for i in range(1, n + 1)]
+    return KindSchema(kinds={roi + param: 'config'
+                             for roi in rois for param in ROI_PARAMS},
+                      configuration_attrs=rois)
+
+
+class KindSchemaMixin:
+    """Applies the class's ``kind_schema`` (plus an optional per-instance
+    ``kind_schema=`` argument) once the device is built."""
+    kind_schema = KindSchema()
+
+    def __init__(self, *args, kind_schema=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        schema = type(self).kind_schema
+        if kind_schema is not None:
+            schema = schema + kind_schema
+        schema.apply(self)
+        # what was applied, for reference
+        self.kind_schema = schema
 
 
 ##TODO why AreaDetector and not ProsilicaDetector for StandardCam Class below
-class StandardCam(SingleTrigger, AreaDetector):#TODO is there something more standard for prosilica? seems only used on prosilica. this does stats, but no image saving (unsure if easy to configure or not and enable/disable)
+class StandardCam(KindSchemaMixin, SingleTrigger, AreaDetector):#TODO is there something more standard for prosilica? seems only used on prosilica. this does stats, but no image saving (unsure if easy to configure or not and enable/disable)
     stats1 = Cpt(StatsPlugin, 'Stats1:')
     stats2 = Cpt(StatsPlugin, 'Stats2:')
     stats3 = Cpt(StatsPlugin, 'Stats3:')
@@ -164,8 +309,8 @@ class AxisDetectorCam(AreaDetectorCam):
                 cpt.ensure_nonblocking()
 
 
-# TODO: Change from `SingleTrigger` to `ContinuousAcquisitionTrigger`
-class StandardAxisCam(SingleTrigger, AreaDetector):
+class AxisCamPlugins(AreaDetector):
+    "The cam and plugins of the AXIS detector, whichever way it is triggered."
     cam = Cpt(AxisDetectorCam, "cam1:")
     stats1 = Cpt(StatsPlugin, 'Stats1:')
     stats2 = Cpt(StatsPlugin, 'Stats2:')
@@ -181,11 +326,16 @@ class StandardAxisCam(SingleTrigger, AreaDetector):
     over1 = Cpt(OverlayPlugin, 'Over1:')
 
 
-class NoStatsCam(SingleTrigger, AreaDetector):
+# one acquisition per trigger; see ContinuousAxisCam for the other way
+class StandardAxisCam(KindSchemaMixin, SingleTrigger, AxisCamPlugins):
     pass
 
 
-class MonitorStatsCam(SingleTrigger, AreaDetector): #TODO does this subscribe/unsubsribe work or are we hacking EpicsSignals in custom plans
+class NoStatsCam(KindSchemaMixin, SingleTrigger, AreaDetector):
+    pass
+
+
+class MonitorStatsCam(KindSchemaMixin, SingleTrigger, AreaDetector): #TODO does this subscribe/unsubsribe work or are we hacking EpicsSignals in custom plans
     stats1 = Cpt(StatsPlugin, "Stats1:")
     roi1 = Cpt(ROIPlugin, "ROI1:")
     proc1 = Cpt(ProcessPlugin, "Proc1:")
@@ -221,6 +371,8 @@ def update_describe_typing(dic, obj):
 
 class HDF5PluginWithFileStorePlain(HDF5Plugin_V22, FileStoreHDF5IterativeWrite): ##SOURCED FROM BELOW FROM FCCD WITH SWMR removed
     _default_read_attrs = ("time_stamp",)
+    # spec of the resource the timestamp datums point at
+    ts_spec = "AD_HDF5_DET_TS"
     # Captures the datum id for the timestamp recorded in the HDF5 file
     time_stamp = Cpt(ExternalFileReference, value="", kind="normal", shape=[])
 
@@ -232,9 +384,13 @@ class HDF5PluginWithFileStorePlain(HDF5Plugin_V22, FileStoreHDF5IterativeWrite):
         self.stage_sigs.move_to_end("create_directory", last=False)
 
         # Setup for timestamping using the detector
-        self._ts_datum_factory = None
         self._ts_resource_uid = ""
         self._ts_counter = None
+        self._ts_page = None
+
+    def _new_ts_page(self):
+        # datums are kept as columns and go out as a datum_page
+        return {"resource": self._ts_resource_uid, "datum_id": [], "datum_kwargs": {}}
 
     def stage(self):
         # Start the timestamp counter
@@ -265,8 +421,8 @@ class HDF5PluginWithFileStorePlain(HDF5Plugin_V22, FileStoreHDF5IterativeWrite):
 
         # Query for the AD_HDF5_TS timestamp
         # See https://github.com/bluesky/area-detector-handlers/blob/master/area_detector_handlers/handlers.py#L230
-        resource, self._ts_datum_factory = resource_factory(
-            spec="AD_HDF5_DET_TS",
+        resource, _ = resource_factory(
+            spec=self.ts_spec,
             root=str(self.reg_root),
             resource_path=str(fn),
             resource_kwargs=resource_kwargs,
@@ -274,22 +430,57 @@ class HDF5PluginWithFileStorePlain(HDF5Plugin_V22, FileStoreHDF5IterativeWrite):
         )
 
         self._ts_resource_uid = resource["uid"]
+        self._ts_page = self._new_ts_page()
         self._asset_docs_cache.append(("resource", resource))
 
     def generate_datum(self, key, timestamp, datum_kwargs):
         ret = super().generate_datum(key, timestamp, datum_kwargs)
-        datum_kwargs = datum_kwargs or {}
-        datum_kwargs.update({"point_number": next(self._ts_counter)})
-        # make the timestamp datum, in this case we know they match
-        datum = self._ts_datum_factory(datum_kwargs)
-        datum_id = datum["datum_id"]
-
-        # stash so that we can collect later
-        self._asset_docs_cache.append(("datum", datum))
+        i = next(self._ts_counter)
+        # make the timestamp datum, in this case we know they match; one
+        # datum covers all the frames of the point
+        datum_id = f"{self._ts_resource_uid}/{i}"
+        # super() has put its own point_number into datum_kwargs already; the
+        # timestamp datum numbers its points with its own counter
+        ts_kwargs = {k: v for k, v in (datum_kwargs or {}).items()
+                     if k != "point_number"}
+        ts_kwargs["point_number"] = i
+        page = self._ts_page
+        page["datum_id"].append(datum_id)
+        for k, v in ts_kwargs.items():
+            page["datum_kwargs"].setdefault(k, []).append(v)
+
         # put in the soft-signal so it gets auto-read later
         self.time_stamp.put(datum_id)
         return ret
 
+    def collect_asset_docs(self):
+        """Resources as they are, datums as one datum_page per resource.
+
+        A datum_page can only refer to one resource, so the image and the
+        timestamp datums of the same points go out as two pages.
+        """
+        items = list(self._asset_docs_cache)
+        self._asset_docs_cache.clear()
+        pages = {}
+        for name, doc in items:
+            if name != "datum":
+                yield name, doc
+                continue
+            page = pages.setdefault(doc["resource"], {"resource": doc["resource"],
+                                                      "datum_id": [], "datum_kwargs": {}})
+            page["datum_id"].append(doc["datum_id"])
+            for k, v in doc["datum_kwargs"].items():
+                page["datum_kwargs"].setdefault(k, []).append(v)
+        if self._ts_page is not None and self._ts_page["datum_id"]:
+            pages[self._ts_resource_uid] = self._ts_page
+            self._ts_page = self._new_ts_page()
+        for page in pages.values():
+            yield "datum_page", page
+
+    def unstage(self):
+        self._ts_page = None
+        return super().unstage()
+
 
 class StandardProsilicaWithHDF5(StandardCam):
     hdf5 = Cpt(HDF5PluginWithFileStorePlain,
@@ -358,6 +549,91 @@ class HDF5PluginSWMR(HDF5Plugin):
 class HDF5PluginWithFileStore(HDF5PluginSWMR, FileStoreHDF5IterativeWrite):
     # AD v2.2.0 (at least) does not have this. It is present in v1.9.1.
     file_number_sync = None
+    # write a VDS index of all the files of the run after unstage, see
+    # csx1.analysis.vds
+    write_vds = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._run_files = []
+        self._vds_fn = None
+        self._vds_threads = deque()
+
+    def stage(self):
+        self._run_files = []
+        self._vds_fn = None
+        staged = super().stage()
+        self._declare_vds()
+        return staged
+
+    def _declare_vds(self):
+        if not self.write_vds:
+            return
+        # declare it now so it goes out with the first frames
+        self._vds_fn = vds_name(self._fn)
+        resource, _ = resource_factory(
+            spec=VDS_SPEC,
+            root=str(self.reg_root),
+            resource_path=str(PurePath(self._vds_fn).relative_to(self.reg_root)),
+            resource_kwargs={'dataset': '/entry/data/data'},
+            path_semantics=self.path_semantics,
+        )
+        self._asset_docs_cache.append(("resource", resource))
+
+    def _write_vds(self):
+        # the files are on GPFS and opening them all takes a while, so the
+        # index is written after the run, off the RunEngine thread
+        files, vds_fn = self._run_files, self._vds_fn
+        self._run_files, self._vds_fn = [], None
+        if vds_fn is None or not files:
+            return
+        thread = threading.Thread(target=self._build_vds, args=(files, vds_fn),
+                                  name=f'{self.name}-vds', daemon=True)
+        while self._vds_threads and not self._vds_threads[0].is_alive():
+            self._vds_threads.popleft()
+        self._vds_threads.append(thread)
+        thread.start()
+
+    @staticmethod
+    def _build_vds(files, vds_fn):
+        try:
+            build_vds(files, vds_fn)
+        except Exception:
+            logger.exception('Could not write the VDS index %s; '
+                             'csx1.analysis.vds.build_run_vds can make it later.',
+                             vds_fn)
+
+    def wait_vds(self, timeout=None):
+        "Wait for the VDS indexes still being written."
+        while self._vds_threads:
+            self._vds_threads[0].join(timeout)
+            if self._vds_threads[0].is_alive():
+                return False
+            self._vds_threads.popleft()
+        return True
+
+    def close_file(self):
+        """Finish the file of this run but leave the detector staged.
+
+        For sticky staging: only this plugin unstages (capture off, VDS
+        index, datum bookkeeping dropped), `new_file` stages it again.
+        """
+        self.unstage()
+
+    def new_file(self):
+        "Open a new file and resource for the next run, see `close_file`."
+        self.stage()
+
+    def _generate_resource(self, resource_kwargs):
+        # also called by ProductionCamStandard.resume for each new file
+        super()._generate_resource(resource_kwargs)
+        self._run_files.append(self._fn)
+
+    def unstage(self):
+        # capture goes back to 0 here, which closes the last file
+        unstaged = super().unstage()
+        self._write_vds()
+        return unstaged
 
     def get_frames_per_point(self):
         return self.parent.cam.num_images.get()
@@ -368,6 +644,17 @@ class HDF5PluginWithFileStore(HDF5PluginSWMR, FileStoreHDF5IterativeWrite):
         return self._ret
 
 
+def _axis_hdf5():
+    # The IOC is currently hosted on a Windows machine so the
+    # `write_path_template` must be specified as a Windows path.
+    return Cpt(HDF5PluginWithFileStorePlain,
+               suffix='HDF1:',
+               read_path_template='/nsls2/data/csx/legacy/axis_data/hdf5/%Y/%m/%d',
+               root='/nsls2/data/csx/legacy/axis_data/hdf5',
+               write_path_template='Z:/hdf5/%Y/%m/%d', # From the IOC which is Windows
+               path_semantics='windows')
+
+
 class AxisCam(StandardAxisCam):
     """
     Class for Axis detector with HDF5 file saving.
@@ -375,12 +662,7 @@ class AxisCam(StandardAxisCam):
     The IOC is currently hosted on a Windows machine so the
     `write_path_template` must be specified as a Windows path.
     """
-    hdf5 = Cpt(HDF5PluginWithFileStorePlain,
-              suffix='HDF1:',
-              read_path_template='/nsls2/data/csx/legacy/axis_data/hdf5/%Y/%m/%d',
-              root='/nsls2/data/csx/legacy/axis_data/hdf5',
-              write_path_template='Z:/hdf5/%Y/%m/%d', # From the IOC which is Windows
-              path_semantics='windows')
+    hdf5 = _axis_hdf5()
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.hdf5.kind = "normal"
@@ -408,13 +690,31 @@ class AxisCam(StandardAxisCam):
         # If the image mode was continuous, start acquiring again
         if self.ensure_acquiring:
             self.cam.image_mode.put("Continuous")
-            ttime.sleep(1)
+            wait_for_value(self.cam.image_mode, "Continuous")
             self.cam.acquire.put(1)
 
         # Adjust timeout back to original value
         self.cam.acquire._timeout -= self.additional_timeout
 
 
+class ContinuousAxisCam(KindSchemaMixin, ContinuousAcquisitionTrigger,
+                        AxisCamPlugins):
+    """The AXIS detector left acquiring, with one HDF5 file per run.
+
+    Each trigger takes the next ``num_images`` frames into the file, see
+    ContinuousAcquisitionTrigger.  ``axis1: [continuous, ...]`` in
+    experiment.yml loads axis1 as this instead of AxisCam.
+    """
+    hdf5 = _axis_hdf5()
+
+    def __init__(self, *args, plugin_name='hdf5', **kwargs):
+        super().__init__(*args, plugin_name=plugin_name, **kwargs)
+        self.hdf5.kind = "normal"
+        self.hdf5.file_path.path_semantics = "nt" # windows path semantics
+        # Camera is currently UInt16, the default is wrong at Int8
+        self.cam.data_type.set("UInt16")
+
+
 class FCCDCam(AreaDetectorCam):
     sdk_version = Cpt(EpicsSignalRO, 'SDKVersion_RBV')
     firmware_version = Cpt(EpicsSignalRO, 'FirmwareVersion_RBV')
@@ -440,7 +740,7 @@ class FastCCDPlugin(PluginBase):
     overscan_cols = Cpt(EpicsSignalWithRBV, 'OverscanCols')
 
 
-class ProductionCamBase(DetectorBase):
+class ProductionCamBase(KindSchemaMixin, DetectorBase):
     # # Trying to add useful info..
     cam = Cpt(FCCDCam, "cam1:")
     stats1 = Cpt(StatsPluginCSX, 'Stats1:')
@@ -457,10 +757,13 @@ class ProductionCamBase(DetectorBase):
     over1 = Cpt(OverlayPlugin, 'Over1:')
     fccd1 = Cpt(FastCCDPlugin, 'FastCCD1:')
 
-    # This does nothing, but it's the right place to add code to be run
-    # once at instantiation time.
+    # how long stage waits for the detector to go Idle
+    idle_timeout = 30
+
     def __init__(self, *arg, readout_time=0.04, **kwargs):
         self.readout_time = readout_time
+        # seconds stage waited for Idle, most recent last
+        self.time_to_idle = deque(maxlen=1000)
         super().__init__(*arg, **kwargs)
 
     def pause(self):
@@ -477,8 +780,8 @@ class ProductionCamBase(DetectorBase):
         self._original_vals[self.cam.acquire] = self.cam.acquire.get()
         self.cam.acquire.set(0).wait(DEFAULT_TIMEOUT)
         # but then watch for when detector state
-        while self.cam.detector_state.get(as_string=True) != 'Idle':
-            ttime.sleep(.01)
+        self.time_to_idle.append(wait_for_value(self.cam.detector_state, 'Idle',
+                                                timeout=self.idle_timeout))
 
         return super().stage()
 
@@ -622,6 +925,24 @@ class ProductionCamTriggered(ProductionCamStandard):
     mcs = FCpt(StruckSIS3820MCS, '{self._mcs_prefix}')
     exposure = Cpt(TriggeredCamExposure, '')
 
+    # The FastCCD: images go to the HDF5 file, the MCS gives the counts.
+    kind_schema = KindSchema(
+        read_attrs=['hdf5', 'mcs.wfrm'],
+        sub_read_attrs={'hdf5': []},
+        kinds={attr: 'config' for attr in [
+            'cam.acquire_time', 'cam.acquire_period',
+            'cam.image_mode', 'cam.num_images',
+            'cam.sdk_version', 'cam.firmware_version',
+            'cam.overscan_cols', 'cam.fcric_gain', 'cam.fcric_clamp',
+            'dg1', 'dg2',
+            'dg2.A', 'dg2.B', 'dg2.C', 'dg2.D',
+            'dg2.E', 'dg2.F', 'dg2.G', 'dg2.H',
+            'dg1.A', 'dg1.B', 'dg1.C', 'dg1.D',
+            'dg1.E', 'dg1.F', 'dg1.G', 'dg1.H',
+            'fccd1.enable_bgnd', 'fccd1.enable_gain', 'fccd1.enable_size',
+            'fccd1.rows', 'fccd1.row_offset', 'fccd1.overscan_cols',
+        ]})
+
     def __init__(self, *args, dg1_prefix=None, dg2_prefix=None,
                  mcs_prefix=None, **kwargs):
         self._dg1_prefix = dg1_prefix
@@ -639,27 +960,85 @@ class ProductionCamTriggered(ProductionCamStandard):
 
 
 class StageOnFirstTrigger(ProductionCamTriggered):
+    """Stages on the first trigger of a run rather than at stage.
+
+    With ``sticky = True`` (or inside ``with fccd.sticky_session():``) it
+    also stays staged between runs: the end of a run only closes the HDF5
+    file, and the first trigger of the next run opens a new file and
+    resource.  If the configuration or the stage_sigs changed in between it
+    unstages and stages again as usual.  ``end_session()`` unstages for
+    real.
+    """
+    sticky = False
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.trigger_staged = False
+        # staged, but the run it was staged for is over
+        self._between_runs = False
+        self._staged_config = None
+
+    def _config_fingerprint(self):
+        def stage_sigs(dev):
+            yield dev.name, tuple((str(k), repr(v)) for k, v in dev.stage_sigs.items())
+            for attr in dev._sub_devices:
+                yield from stage_sigs(getattr(dev, attr))
+
+        config = {k: repr(v['value']) for k, v in self.read_configuration().items()}
+        return config, tuple(stage_sigs(self))
 
     def _trigger_stage(self):
 
         self._acquisition_signal.subscribe(self._acquire_changed)
-        return super().stage()
+        staged = super().stage()
+        if self.sticky:
+            self._staged_config = self._config_fingerprint()
+        return staged
 
     def stage(self):
         return [self]
 
     def unstage(self):
+        if self.sticky and self.trigger_staged:
+            if not self._between_runs:
+                self.hdf5.close_file()
+                self._between_runs = True
+            return [self]
+        self._full_unstage()
+
+    def _full_unstage(self):
         super().unstage()
         self._acquisition_signal.clear_sub(self._acquire_changed)
         self.trigger_staged = False
+        self._between_runs = False
+        self._staged_config = None
+
+    @contextmanager
+    def sticky_session(self):
+        "Stay staged across the runs in the block."
+        self.sticky = True
+        try:
+            yield self
+        finally:
+            self.sticky = False
+            self.end_session()
+
+    def end_session(self):
+        "Unstage if sticky staging left the detector staged."
+        if self.trigger_staged:
+            self._full_unstage()
 
     def trigger(self):
         import time as ttime
 
+        if self._between_runs:
+            if self.sticky and self._config_fingerprint() == self._staged_config:
+                self.hdf5.new_file()
+                self._between_runs = False
+            else:
+                self._full_unstage()
+
         if not self.trigger_staged:
             self._trigger_stage()
             self.trigger_staged = True
@@ -0,0 +1,570 @@
+"""Baseline readings served from CA monitors.
+
+The stock ``SupplementalData`` reads every device in ``sd.baseline`` at the
+open and close of each run with one blocking CA get per signal, one device
+after the other, for readings *and* configuration.  With ~25 devices that is
+a few hundred round trips per run, which dominates short ``count`` and
+``rel_scan`` runs.
+
+:class:`MonitoredBaseline` is a drop-in replacement: each baseline device is
+wrapped in a reader that keeps its EPICS signals subscribed and builds the
+baseline event from the latest monitor values.  Values that are missing,
+disconnected or older than ``max_age`` are read fresh, all at once on a
+thread pool, when the baseline is triggered.  Devices whose readings are not
+plain EPICS signals (pseudo positioners like the tardis, devices with their
+own ``read()``) are always read fresh, but in parallel with the rest.
+
+``max_age=None`` (the default) trusts the monitors for as long as the PVs
+stay connected.  Note that monitors honour the record's MDEL/ADEL deadband,
+so set ``sd.max_age`` (seconds) if a baseline value must be more exact than
+that; ``sd.max_age = 0`` reads everything fresh (still in parallel).
+
+Devices in ``sd.slow_baseline`` are read like the others, but only every
+``sd.slow_every`` runs or ``sd.slow_interval`` seconds; runs that skip them
+point at the last run that has them.  ``sd.audit()`` tells which devices are
+worth moving there.
+
+With ``sd.delta = True`` runs only record the baseline values that differ
+from a reference run that has the full baseline; see
+:meth:`MonitoredBaseline._baseline_wrapper` and
+:func:`csx1.analysis.baseline.full_baseline` to put them back together.
+"""
+import json
+import logging
+import threading
+import time as ttime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bluesky.plan_stubs as bps
+import numpy as np
+from bluesky.preprocessors import (SupplementalData, monitor_during_wrapper,
+                                   fly_during_wrapper, plan_mutator)
+from bluesky.utils import Msg, short_uid
+from ophyd import Device, Signal
+from ophyd.signal import EpicsSignalBase
+from ophyd.status import Status, wait as status_wait
+
+
+logger = logging.getLogger(__name__)
+
+# read() implementations that just collect the readings of the components,
+# so the result can be put together from the signals alone
+_PLAIN_READS = {Device.read, Signal.read, EpicsSignalBase.read}
+
+
+def _attach_ca_context():
+    # pyepics wants every thread that does CA to share the initial context
+    import ophyd
+    if ophyd.cl.name == 'pyepics':
+        from epics import ca
+        ca.use_initial_context()
+
+
+def _leaf_signals(device, attrs):
+    """The EPICS signals whose readings make up ``device.read()`` (or
+    ``read_configuration()`` for ``attrs='configuration_attrs'``).
+
+    Returns None if that cannot be put together from monitored signals.
+    """
+    if isinstance(device, Signal):
+        if attrs != 'read_attrs':
+            return None
+        candidates = [device]
+    else:
+        if device.__class__.read not in _PLAIN_READS:
+            return None
+        candidates = []
+        for attr in getattr(device, attrs):
+            obj = getattr(device, attr)
+            if isinstance(obj, Device):
+                if obj.__class__.read not in _PLAIN_READS:
+                    return None
+                continue
+            candidates.append(obj)
+    for sig in candidates:
+        if not isinstance(sig, EpicsSignalBase) or sig.__class__.read not in _PLAIN_READS:
+            return None
+    return candidates
+
+
+def _same(a, b):
+    try:
+        return np.array_equal(a, b, equal_nan=True)
+    except TypeError:
+        # strings, or nan checks on things that are not numbers
+        return np.array_equal(a, b)
+
+
+def _all_leaves(device, attrs):
+    if isinstance(device, Signal):
+        return [device] if attrs == 'read_attrs' else []
+    return [sig for sig in (getattr(device, attr) for attr in getattr(device, attrs))
+            if isinstance(sig, Signal)]
+
+
+class BaselineAudit:
+    """Result of :func:`audit_baseline`; ``print()`` it for the table.
+
+    Attributes
+    ----------
+    rows : list of dict
+        Per device: ``name``, ``tier``, ``pvs`` (EPICS PVs read),
+        ``event_bytes`` and ``config_bytes`` (JSON size of one reading and
+        of the configuration), ``latency`` (seconds for a plain sequential
+        read, what the stock baseline pays per device at open and at close)
+        and ``monitored`` (whether MonitoredBaseline can serve it from
+        monitors).
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    @property
+    def total_latency(self):
+        return sum(row['latency'] for row in self.rows)
+
+    def __str__(self):
+        total = self.total_latency or 1
+        lines = [f'Baseline of {len(self.rows)} devices, '
+                 f'{sum(row["pvs"] for row in self.rows)} PVs, '
+                 f'{sum(row["event_bytes"] for row in self.rows)} bytes per event, '
+                 f'{self.total_latency:.3f} s per sequential read', '',
+                 f'{"device":<20} {"tier":<5} {"PVs":>4} {"event B":>8} '
+                 f'{"config B":>9} {"read [s]":>9} {"share":>6}  monitored']
+        for row in sorted(self.rows, key=lambda row: -row['latency']):
+            lines.append(f'{row["name"]:<20} {row["tier"]:<5} {row["pvs"]:>4} '
+                         f'{row["event_bytes"]:>8} {row["config_bytes"]:>9} '
+                         f'{row["latency"]:>9.3f} {row["latency"] / total:>6.1%}  '
+                         f'{"yes" if row["monitored"] else "no"}')
+        return '\n'.join(lines)
+
+    __repr__ = __str__
+
+
+def audit_baseline(devices, *, tiers=None, repeat=3):
+    """Measure what each baseline device costs per run.
+
+    Parameters
+    ----------
+    devices : list
+        E.g. ``sd.baseline``.
+    tiers : dict, optional
+        Device name -> tier label shown in the report.
+    repeat : int, optional
+        The latency is the best of this many reads.
+
+    Returns
+    -------
+    BaselineAudit
+    """
+    tiers = tiers or {}
+    rows = []
+    for device in devices:
+        signals = (_all_leaves(device, 'read_attrs')
+                   + _all_leaves(device, 'configuration_attrs'))
+        latency = float('inf')
+        for _ in range(repeat):
+            t0 = ttime.monotonic()
+            readings = device.read()
+            config = device.read_configuration()
+            latency = min(latency, ttime.monotonic() - t0)
+        rows.append({
+            'name': device.name,
+            'tier': tiers.get(device.name, 'fast'),
+            'pvs': len({sig.pvname for sig in signals if hasattr(sig, 'pvname')}),
+            'event_bytes': len(json.dumps(readings, default=str)),
+            'config_bytes': len(json.dumps(config, default=str)),
+            'latency': latency,
+            'monitored': (_leaf_signals(device, 'read_attrs') is not None
+                          and (isinstance(device, Signal)
+                               or _leaf_signals(device, 'configuration_attrs') is not None)),
+        })
+    return BaselineAudit(rows)
+
+
+class BaselineReader:
+    """Stands in for one baseline device in the baseline stream.
+
+    Looks like the device to the RunEngine (same name, description and
+    hints) but answers ``read()`` and ``read_configuration()`` from the
+    monitor cache, refreshing stale values in ``trigger()``.
+    """
+    parent = None
+
+    def __init__(self, device, baseline):
+        self.device = device
+        self.baseline = baseline
+        self._subs = {}
+        self._values = {}
+        self._fresh = {}
+        self.last_read = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'BaselineReader({self.device.name!r})'
+
+    @property
+    def name(self):
+        return self.device.name
+
+    @property
+    def hints(self):
+        return getattr(self.device, 'hints', {})
+
+    def describe(self):
+        return self.device.describe()
+
+    def describe_configuration(self):
+        return self.device.describe_configuration()
+
+    def _signals(self, attrs):
+        signals = _leaf_signals(self.device, attrs)
+        for sig in signals or ():
+            if sig not in self._subs:
+                self._subs[sig] = sig.subscribe(self._update, event_type=sig.SUB_VALUE,
+                                                run=True)
+        return signals
+
+    def monitor(self):
+        "Subscribe to the signals now rather than at the first run."
+        self._signals('read_attrs')
+        self._signals('configuration_attrs')
+
+    def clear(self):
+        for sig, cid in self._subs.items():
+            sig.unsubscribe(cid)
+        self._subs.clear()
+        self._values.clear()
+
+    def _update(self, *, value, timestamp=None, obj, **kwargs):
+        if timestamp is None:
+            timestamp = ttime.time()
+        with self._lock:
+            self._values[obj] = ({'value': value, 'timestamp': timestamp},
+                                 ttime.monotonic())
+
+    def _refresh(self, sig):
+        reading = sig.read()[sig.name]
+        with self._lock:
+            self._values[sig] = (reading, ttime.monotonic())
+
+    def _is_stale(self, sig, now):
+        entry = self._values.get(sig)
+        if entry is None or not sig.connected:
+            return True
+        max_age = self.baseline.max_age
+        return max_age is not None and now - entry[1] > max_age
+
+    def _read_whole(self, method):
+        if method == 'read':
+            status_wait(self.device.trigger())
+        self._fresh[method] = getattr(self.device, method)()
+
+    def trigger(self):
+        now = ttime.monotonic()
+        jobs = []
+        for attrs, method in (('read_attrs', 'read'),
+                              ('configuration_attrs', 'read_configuration')):
+            signals = self._signals(attrs)
+            if signals is None:
+                jobs.append((self._read_whole, method))
+            else:
+                jobs.extend((self._refresh, sig) for sig in signals
+                            if self._is_stale(sig, now))
+        return self.baseline._submit(jobs)
+
+    def _assemble(self, attrs, method):
+        fresh = self._fresh.pop(method, None)
+        if fresh is not None:
+            return fresh
+        signals = self._signals(attrs)
+        if signals is None:
+            return getattr(self.device, method)()
+        readings = OrderedDict()
+        for sig in signals:
+            if sig not in self._values:
+                # read() without trigger(), or the monitor never fired
+                self._refresh(sig)
+            readings[sig.name] = dict(self._values[sig][0])
+        return readings
+
+    def read(self):
+        self.last_read = self._assemble('read_attrs', 'read')
+        return self.last_read
+
+    def read_configuration(self):
+        return self._assemble('configuration_attrs', 'read_configuration')
+
+
+class MonitoredBaseline(SupplementalData):
+    """``SupplementalData`` whose baseline is read from CA monitors.
+
+    Use like the stock one (``sd.baseline``, ``sd.monitors`` and
+    ``sd.flyers`` are the same plain lists); see the module docstring.
+
+    Parameters
+    ----------
+    max_age : float, optional
+        Seconds a monitored value is trusted without being read again;
+        None trusts it as long as the PV is connected.
+    workers : int, optional
+        Threads used for fresh reads.
+    timeout : float, optional
+        Give up on the fresh reads of a baseline after this long.
+    delta : bool, optional
+        Only record what changed since the last full baseline.
+    full_every : int, optional
+        In delta mode, record the full baseline again after this many runs.
+    slow_baseline : list, optional
+        Devices only read every ``slow_every`` runs or ``slow_interval``
+        seconds, whichever comes first (None switches either off).
+    """
+    def __init__(self, *args, max_age=None, workers=16, timeout=10,
+                 delta=False, full_every=100, slow_baseline=None,
+                 slow_every=10, slow_interval=30 * 60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+        self.delta = delta
+        self.full_every = full_every
+        self.reference = None
+        self.slow_baseline = list(slow_baseline or [])
+        self.slow_every = slow_every
+        self.slow_interval = slow_interval
+        self.slow_reference = None
+        self.timeout = timeout
+        self._readers = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='baseline',
+                                            initializer=_attach_ca_context)
+
+    @classmethod
+    def replace(cls, RE, sd, **kwargs):
+        """Swap ``sd`` for a MonitoredBaseline in ``RE.preprocessors``.
+
+        Returns the new instance, which takes over the lists of ``sd``.
+        """
+        new = cls(baseline=sd.baseline, monitors=sd.monitors, flyers=sd.flyers,
+                  **kwargs)
+        RE.preprocessors[RE.preprocessors.index(sd)] = new
+        return new
+
+    def readers(self, devices=None):
+        """A reader per device in ``devices`` (default: both baseline tiers).
+
+        Readers of devices that left both tiers are dropped, along with
+        their subscriptions.
+        """
+        readers = OrderedDict()
+        for device in self.baseline + self.slow_baseline:
+            reader = self._readers.get(id(device))
+            if reader is None or reader.device is not device:
+                reader = BaselineReader(device, self)
+            readers[id(device)] = reader
+        for key, reader in self._readers.items():
+            if readers.get(key) is not reader:
+                reader.clear()
+        self._readers = readers
+        if devices is None:
+            return list(readers.values())
+        return [readers[key] for key in OrderedDict.fromkeys(map(id, devices))]
+
+    def audit(self, *, repeat=3):
+        "Per-device cost of the baseline, see :func:`audit_baseline`."
+        tiers = {device.name: 'slow' for device in self.slow_baseline}
+        return audit_baseline(self.baseline + self.slow_baseline, tiers=tiers,
+                              repeat=repeat)
+
+    def slow_due(self):
+        "Whether the next run reads ``slow_baseline``."
+        last = self.slow_reference
+        if not self.slow_baseline:
+            return False
+        if last is None or last['names'] != [d.name for d in self.slow_baseline]:
+            return True
+        if self.slow_every is not None and last['runs'] >= self.slow_every:
+            return True
+        return (self.slow_interval is not None
+                and ttime.monotonic() - last['time'] >= self.slow_interval)
+
+    def start_monitoring(self):
+        """Subscribe to every baseline signal in the background, so that
+        even the first run is served from the monitors."""
+        def monitor_all():
+            for reader in self.readers():
+                try:
+                    reader.monitor()
+                except Exception as err:
+                    logger.warning('Could not monitor baseline device %s: %r',
+                                   reader.name, err)
+        return self._executor.submit(monitor_all)
+
+    def _submit(self, jobs):
+        status = Status(timeout=self.timeout)
+        if not jobs:
+            status.set_finished()
+            return status
+        remaining = [len(jobs)]
+        lock = threading.Lock()
+
+        def done(future):
+            err = future.exception()
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if status.done:
+                return
+            if err is not None:
+                status.set_exception(err)
+            elif last:
+                status.set_finished()
+
+        for func, arg in jobs:
+            self._executor.submit(func, arg).add_done_callback(done)
+        return status
+
+    def __call__(self, plan):
+        plan = monitor_during_wrapper(plan, self.monitors)
+        plan = fly_during_wrapper(plan, self.flyers)
+        if self.baseline or self.slow_baseline:
+            plan = self._baseline_wrapper(plan)
+        return plan
+
+    def reset_reference(self):
+        "Make the next run record the full baseline again."
+        self.reference = None
+
+    def _baseline_wrapper(self, plan):
+        """Read the baseline at the open and close of every run of `plan`.
+
+        What each run reads is decided at its ``open_run``, so every run of
+        a plan that opens several is treated like a run of its own:
+
+        * ``slow_baseline`` is read when :meth:`slow_due`; that run becomes
+          the slow reference, the others name it as
+          ``baseline_slow_reference`` in their start document.
+        * With ``delta`` the first run (and every ``full_every``-th run
+          after it, or any run with a baseline device the reference lacks)
+          records the full baseline as usual and becomes the reference.
+          Later runs carry its uid as ``baseline_reference`` in their start
+          document and read the baseline at open and close as usual, but
+          only write the fields that differ from the last baseline event of
+          the reference, and only at close (the open event keeps the
+          timestamps of when it was read).  A run in which nothing changed
+          has no baseline stream at all.
+        """
+        # per run key (msg.run) of the runs open right now
+        runs = {}
+
+        def snapshot(readers):
+            group = short_uid('baseline')
+            for reader in readers:
+                yield from bps.trigger(reader, group=group)
+            yield from bps.wait(group)
+            return [reader.read() for reader in readers]
+
+        def open_run(msg):
+            slow = self.slow_due()
+            readers = self.readers(self.baseline + (self.slow_baseline if slow else []))
+            names = tuple(reader.name for reader in readers)
+            reference = self.reference if self.delta else None
+            # runs without the slow tier are still covered by a full reference
+            full = (not self.delta or reference is None
+                    or not set(names) <= set(reference['names'])
+                    or reference['runs'] >= self.full_every)
+            run = runs[msg.run] = {'readers': readers, 'names': names,
+                                   'full': full, 'delta': self.delta,
+                                   'reference': reference}
+            kwargs = dict(msg.kwargs)
+            if self.slow_baseline and not slow:
+                kwargs['baseline_slow_reference'] = self.slow_reference['uid']
+            if not full:
+                kwargs['baseline_reference'] = reference['uid']
+            if kwargs != msg.kwargs:
+                msg = msg._replace(kwargs=kwargs)
+            run['uid'] = uid = yield msg
+            if slow:
+                self.slow_reference = {
+                    'uid': uid, 'time': ttime.monotonic(), 'runs': 0,
+                    'names': [d.name for d in self.slow_baseline]}
+            elif self.slow_baseline:
+                self.slow_reference['runs'] += 1
+            if not full:
+                run['opened'] = yield from snapshot(readers)
+            elif readers:
+                yield from bps.trigger_and_read(readers, name='baseline')
+            return uid
+
+        def close_full(run, msg):
+            readers = run['readers']
+            if readers:
+                yield from bps.trigger_and_read(readers, name='baseline')
+            ret = yield msg
+            if run['delta'] and readers:
+                values = {}
+                for reader in readers:
+                    values.update((key, reading['value'])
+                                  for key, reading in reader.last_read.items())
+                self.reference = {'uid': run['uid'], 'names': run['names'],
+                                  'values': values, 'runs': 0}
+            return ret
+
+        def close_delta(run, msg):
+            readers = run['readers']
+            closed = yield from snapshot(readers)
+            reference = run['reference']
+            values = reference['values']
+            deltas = []
+            for reader, opened, closed_ in zip(readers, run['opened'], closed):
+                keys = [key for key in closed_ if key in opened and (
+                        key not in values
+                        or not _same(opened[key]['value'], values[key])
+                        or not _same(closed_[key]['value'], values[key]))]
+                if keys:
+                    deltas.append(_DeltaReading(reader, keys, [opened, closed_]))
+            for i in range(2 if deltas else 0):
+                yield Msg('create', None, name='baseline')
+                for delta in deltas:
+                    delta.index = i
+                    yield Msg('read', delta)
+                yield Msg('save')
+            reference['runs'] += 1
+            return (yield msg)
+
+        def insert_baseline(msg):
+            # the open_run with the references added comes through here
+            # too, after open_run has registered the run
+            if msg.command == 'open_run' and msg.run not in runs:
+                return open_run(msg), None
+            if msg.command == 'close_run' and msg.run in runs:
+                run = runs.pop(msg.run)
+                return (close_full if run['full'] else close_delta)(run, msg), None
+            return None, None
+
+        return (yield from plan_mutator(plan, insert_baseline))
+
+
+class _DeltaReading:
+    "The changed fields of one baseline device, as read at open and close."
+    parent = None
+    hints = {}
+
+    def __init__(self, reader, keys, readings):
+        self.reader = reader
+        self.name = reader.name
+        self.keys = keys
+        self.readings = readings
+        self.index = 0
+
+    def describe(self):
+        desc = self.reader.describe()
+        return OrderedDict((key, desc[key]) for key in self.keys)
+
+    def read(self):
+        readings = self.readings[self.index]
+        return OrderedDict((key, readings[key]) for key in self.keys)
+
+    def describe_configuration(self):
+        return self.reader.describe_configuration()
+
+    def read_configuration(self):
+        return self.reader.read_configuration()
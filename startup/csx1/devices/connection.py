@@ -0,0 +1,231 @@
+import logging
+import threading
+import time as ttime
+from collections import OrderedDict, defaultdict
+
+from ophyd.ophydobj import OphydObject
+
+from .registry import LazyDevice
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionTimer:
+    """Records when each PV is created and when it first connects.
+
+    ``install()`` wraps ``ophyd.cl.get_pv``, so it has to run before the
+    first device is built (00-nsls2-tools.py) to see every PV.  The
+    difference of the two times is what the IOC (and the CA search) took,
+    wherever in startup the PV happened to be created.
+    """
+    def __init__(self):
+        self.created = {}
+        self.connected = {}
+        self._lock = threading.Lock()
+        self._orig_get_pv = None
+
+    def install(self):
+        from ophyd import cl
+
+        if self._orig_get_pv is not None:
+            return
+        orig = self._orig_get_pv = cl.get_pv
+
+        def get_pv(pvname, *args, connection_callback=None, **kwargs):
+            with self._lock:
+                self.created.setdefault(pvname, ttime.monotonic())
+
+            def connection_changed(*cb_args, **cb_kwargs):
+                if cb_kwargs.get('conn'):
+                    with self._lock:
+                        self.connected.setdefault(pvname, ttime.monotonic())
+                if connection_callback is not None:
+                    return connection_callback(*cb_args, **cb_kwargs)
+
+            return orig(pvname, *args, connection_callback=connection_changed,
+                        **kwargs)
+
+        cl.get_pv = get_pv
+
+    def uninstall(self):
+        from ophyd import cl
+
+        if self._orig_get_pv is not None:
+            cl.get_pv = self._orig_get_pv
+            self._orig_get_pv = None
+
+    def latency(self, pvname):
+        "Seconds from creating the PV to its connection, None if unknown."
+        created = self.created.get(pvname)
+        connected = self.connected.get(pvname)
+        if created is None or connected is None:
+            return None
+        return connected - created
+
+
+def find_devices(namespace, registry=None, *, build=False):
+    """Top-level ophyd objects in ``namespace`` that have been built.
+
+    Lazy devices that nobody has touched yet are skipped, so collecting them
+    does not build them -- unless ``build`` is set, in which case every
+    device of ``registry`` (except the disabled ones) is built first.
+    """
+    found = OrderedDict()
+    if build and registry is not None:
+        for name in registry:
+            dev = registry.materialize(name)
+            found[id(dev)] = dev
+    for obj in list(namespace.values()):
+        if type(obj) is LazyDevice:
+            obj = object.__getattribute__(obj, '_lazy_device')
+        if not isinstance(obj, OphydObject) or obj.parent is not None:
+            continue
+        found[id(obj)] = obj
+    return list(found.values())
+
+
+def _epics_signals(obj, all_signals):
+    if hasattr(obj, 'walk_signals'):
+        signals = (walk.item for walk in obj.walk_signals(include_lazy=all_signals))
+    else:
+        signals = [obj]
+    return [sig for sig in signals if hasattr(sig, 'pvname')]
+
+
+def _server_of(sig):
+    """Best guess at which IOC serves ``sig``.
+
+    The CA client knows the host:port of the server once connected; before
+    that (or if it is never reached) fall back to the PV prefix up to the
+    closing brace, e.g. ``XF:23ID1-ES{Dif-Ax:Th}``.
+    """
+    pv = getattr(sig, '_read_pv', None)
+    host = getattr(pv, 'host', None)
+    if host:
+        return str(host)
+    prefix, brace, _ = sig.pvname.partition('}')
+    return prefix + brace
+
+
+class ConnectionReport:
+    """Result of :func:`connect_all`; ``print()`` it for the summary table.
+
+    Attributes
+    ----------
+    elapsed : float
+        Seconds spent waiting.
+    connected : list of str
+        Names of devices whose signals all connected.
+    missing : dict
+        Device name -> PV names that did not connect before the deadline.
+    servers : dict
+        Server (or PV prefix) -> ``(n_pvs, slowest_seconds)`` for the PVs
+        that connected; the seconds are from creating each PV to its
+        connection callback.
+    """
+    def __init__(self, elapsed, connected, missing, servers):
+        self.elapsed = elapsed
+        self.connected = connected
+        self.missing = missing
+        self.servers = servers
+
+    def _missing_lines(self):
+        lines = [f'Connected {len(self.connected)} devices, '
+                 f'{len(self.missing)} with missing PVs '
+                 f'(waited {self.elapsed:.2f} s)']
+        if self.missing:
+            lines.append('')
+            lines.append(f'{"device":<20} missing PVs')
+            for name, pvs in self.missing.items():
+                shown = ', '.join(pvs[:3]) + (', ...' if len(pvs) > 3 else '')
+                lines.append(f'{name:<20} {len(pvs):>4}  {shown}')
+        return lines
+
+    def missing_table(self):
+        "Just the summary line and the devices with missing PVs."
+        return '\n'.join(self._missing_lines())
+
+    def __str__(self):
+        lines = self._missing_lines()
+        if self.servers:
+            lines.append('')
+            lines.append(f'{"IOC":<40} {"PVs":>5} {"latency [s]":>12}')
+            for server, (count, latency) in sorted(self.servers.items(),
+                                                   key=lambda kv: -kv[1][1]):
+                lines.append(f'{server:<40} {count:>5} {latency:>12.3f}')
+        return '\n'.join(lines)
+
+    __repr__ = __str__
+
+
+def report_connections(report):
+    "Log the whole report, print only what did not connect."
+    logger.info('%s', report)
+    if report.missing:
+        print(report.missing_table())
+
+
+def connect_all(devices, timeout=10, *, all_signals=False, timer=None,
+                poll_period=0.01):
+    """Wait for the PVs of many devices at once, against a single deadline.
+
+    The CA searches for every PV are already in flight once the devices are
+    built (and with ``all_signals`` every lazy component is created before
+    the waiting starts, so its searches go out in one batch), so instead of
+    waiting on each device in turn (one dead IOC costing ``timeout`` per
+    device) all signals are polled together until they are connected or
+    ``timeout`` seconds have passed in total.
+
+    Parameters
+    ----------
+    devices : iterable
+        Built ophyd devices or signals, e.g. from :func:`find_devices`.
+    timeout : float, optional
+        Global deadline in seconds.
+    all_signals : bool, optional
+        Also create and wait for lazy components that have not been used
+        yet (most area detector PVs).  Default False, like
+        ``Device.wait_for_connection``.
+    timer : ConnectionTimer, optional
+        Gives the per-PV latencies; without one the servers are only
+        counted.
+
+    Returns
+    -------
+    ConnectionReport
+    """
+    devices = list(devices)
+    start = ttime.monotonic()
+    deadline = start + timeout
+
+    pending = OrderedDict()
+    for dev in devices:
+        for sig in _epics_signals(dev, all_signals):
+            pending[sig] = dev.name
+
+    connected_sigs = []
+    while pending:
+        now = ttime.monotonic()
+        for sig in [sig for sig in pending if sig.connected]:
+            connected_sigs.append(sig)
+            del pending[sig]
+        if not pending or now >= deadline:
+            break
+        ttime.sleep(poll_period)
+
+    missing = OrderedDict()
+    for sig, dev_name in pending.items():
+        missing.setdefault(dev_name, []).append(sig.pvname)
+
+    servers = defaultdict(lambda: [0, 0.0])
+    for sig in connected_sigs:
+        entry = servers[_server_of(sig)]
+        entry[0] += 1
+        latency = timer.latency(sig.pvname) if timer is not None else None
+        if latency is not None:
+            entry[1] = max(entry[1], latency)
+
+    connected = [dev.name for dev in devices if dev.name not in missing]
+    return ConnectionReport(ttime.monotonic() - start, connected, missing,
+                            {k: tuple(v) for k, v in servers.items()})
@@ -0,0 +1,215 @@
+"""Persistent cache of EPICS control metadata used to answer ``describe()``.
+
+``EpicsSignalBase.describe`` needs the value (for dtype and shape) and the
+control metadata (enum strings, limits, units, precision) of the PV, which
+costs a round trip per signal the first time a device is described -- at
+every run open and again after every restart.  The cache keeps the
+description of every PV it has seen in a JSON file, answers ``describe()``
+from it straight away and re-checks each cached entry against the live PV
+on a background thread the first time it is used in a session.  Entries that
+changed are updated and written back, so a stale cache fixes itself after
+one run.
+
+Array PVs (waveforms) are kept in the file, which the simulated IOC builds
+its PVs from, but are always described live: their shape follows the
+current value (e.g. the MCS waveforms after ``n_use_all`` changes), so a
+cached one would not match the events.
+
+Install once at startup::
+
+    pv_metadata_cache = PVMetadataCache(path)
+    pv_metadata_cache.install()
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time as ttime
+
+from ophyd.signal import EpicsSignalBase
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the file changes; older files are ignored.
+CACHE_VERSION = 1
+
+
+def _jsonable(desc):
+    "Normalize tuples to lists etc. so cached and live descriptions compare."
+    return json.loads(json.dumps(desc, default=str))
+
+
+def _value_dependent(entry):
+    "Whether the description depends on the current value (arrays)."
+    return entry.get('dtype') == 'array' or bool(entry.get('shape'))
+
+
+class PVMetadataCache:
+    """Describe EPICS signals from an on-disk cache, validated lazily.
+
+    Parameters
+    ----------
+    path : str
+        JSON file holding the cache.  It is created if missing; if it
+        cannot be written the cache still works for this session.
+    validate_timeout : float, optional
+        How long the background validation waits for a PV to connect before
+        giving up on it for this session.
+    save_delay : float, optional
+        Changes are written out at most this often (seconds).
+    """
+    def __init__(self, path, *, validate_timeout=10, save_delay=5):
+        self.path = path
+        self.validate_timeout = validate_timeout
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._validated = set()
+        self._queued = set()
+        self._dirty = False
+        self._queue = queue.Queue()
+        self._thread = None
+        self._orig_describe = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                contents = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logger.warning('Ignoring unreadable PV metadata cache %s: %r',
+                           self.path, err)
+            return {}
+        if contents.get('version') != CACHE_VERSION:
+            return {}
+        return contents.get('pvs', {})
+
+    def save(self):
+        "Write the cache out (atomically) if anything changed."
+        with self._lock:
+            if not self._dirty:
+                return
+            contents = {'version': CACHE_VERSION, 'pvs': dict(self._entries)}
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(contents, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            logger.warning('Could not write PV metadata cache %s: %r',
+                           self.path, err)
+
+    @staticmethod
+    def key(sig):
+        # The same PV read with string=True describes differently.
+        string = getattr(sig, 'as_string', getattr(sig, '_string', False))
+        return sig.pvname + ('|string' if string else '')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sig):
+        return self.key(sig) in self._entries
+
+    def describe(self, sig):
+        """Description of ``sig``, from the cache when possible.
+
+        A cache miss falls through to the normal ``describe`` (waiting for
+        the PV) and records the result.  So do array PVs, see the module
+        docstring.
+        """
+        key = self.key(sig)
+        entry = self._entries.get(key)
+        if entry is None or _value_dependent(entry):
+            self.misses += 1
+            desc = self._orig_describe(sig)
+            self._store(key, desc[sig.name])
+            with self._lock:
+                self._validated.add(key)
+            return desc
+        self.hits += 1
+        if key not in self._validated and key not in self._queued:
+            with self._lock:
+                self._queued.add(key)
+            self._queue.put(sig)
+        return {sig.name: dict(entry)}
+
+    def _store(self, key, entry):
+        entry = _jsonable(entry)
+        with self._lock:
+            if self._entries.get(key) != entry:
+                self._entries[key] = entry
+                self._dirty = True
+
+    def validate(self, sig):
+        """Compare the cached entry for ``sig`` with the live PV.
+
+        Returns True if the entry was up to date (or has been fixed), False
+        if the PV could not be reached.
+        """
+        key = self.key(sig)
+        try:
+            sig.wait_for_connection(timeout=self.validate_timeout)
+            live = self._orig_describe(sig)[sig.name]
+        except Exception as err:
+            logger.debug('Could not validate %s: %r', key, err)
+            return False
+        if _jsonable(live) != self._entries.get(key):
+            logger.info('PV metadata for %s changed, updating the cache', key)
+            self._store(key, live)
+        with self._lock:
+            self._validated.add(key)
+        return True
+
+    def _run(self):
+        last_save = ttime.monotonic()
+        while True:
+            try:
+                sig = self._queue.get(timeout=self.save_delay)
+            except queue.Empty:
+                sig = None
+            if sig is not None:
+                self.validate(sig)
+                with self._lock:
+                    self._queued.discard(self.key(sig))
+            if ttime.monotonic() - last_save >= self.save_delay:
+                self.save()
+                last_save = ttime.monotonic()
+
+    def install(self):
+        """Answer ``describe()`` of every EPICS signal from this cache.
+
+        Also starts the background thread that validates cached entries and
+        writes the file.
+        """
+        if self._orig_describe is not None:
+            return
+        self._orig_describe = orig = EpicsSignalBase.describe
+        cache = self
+
+        def describe(self):
+            return cache.describe(self)
+
+        describe.__doc__ = orig.__doc__
+        describe.__wrapped__ = orig
+        EpicsSignalBase.describe = describe
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='pv-metadata-cache')
+        self._thread.start()
+        atexit.register(self.save)
+
+    def uninstall(self):
+        if self._orig_describe is not None:
+            EpicsSignalBase.describe = self._orig_describe
+            self._orig_describe = None
+        self.save()
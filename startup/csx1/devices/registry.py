@@ -0,0 +1,240 @@
+import logging
+import threading
+import time as ttime
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDevice:
+    """Stand-in for a device that is only built when it is first used.
+
+    The proxy knows the device ``name`` without building it; any other
+    attribute access (``read``, ``describe``, ``cam``, ``stats1`` ...),
+    attribute assignment or ``isinstance`` check builds the real device
+    through its :class:`DeviceRegistry` and forwards to it.  Building the
+    device is what creates its PVs, so hardware that is never touched in a
+    session is never connected.
+    """
+
+    def __init__(self, registry, name):
+        object.__setattr__(self, '_lazy_registry', registry)
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_device', None)
+
+    def _lazy_target(self):
+        device = object.__getattribute__(self, '_lazy_device')
+        if device is None:
+            registry = object.__getattribute__(self, '_lazy_registry')
+            device = registry.materialize(object.__getattribute__(self, '_lazy_name'))
+        return device
+
+    @property
+    def __class__(self):
+        # Lets isinstance() see the real device class.
+        return type(self._lazy_target())
+
+    def __getattr__(self, attr):
+        if attr == 'name' and object.__getattribute__(self, '_lazy_device') is None:
+            return object.__getattribute__(self, '_lazy_name')
+        return getattr(self._lazy_target(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._lazy_target(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._lazy_target(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_target())
+
+    def __eq__(self, other):
+        if other is self:
+            return True
+        device = object.__getattribute__(self, '_lazy_device')
+        if type(other) is LazyDevice:
+            other = object.__getattribute__(other, '_lazy_device')
+        # An unbuilt device cannot be equal to anything else.
+        return device is not None and device is other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._lazy_target())
+
+    def __repr__(self):
+        device = object.__getattribute__(self, '_lazy_device')
+        if device is None:
+            name = object.__getattribute__(self, '_lazy_name')
+            return f'<LazyDevice {name!r} (not built yet)>'
+        return repr(device)
+
+
+class DeviceNotLoadedError(AttributeError):
+    """Raised on using a :class:`DisabledDevice`.
+
+    An AttributeError, so ``hasattr(dev, 'read')`` and ``getattr(dev, attr,
+    default)`` behave as for any object that lacks the attribute.
+    """
+    def __init__(self, name, attr, reason):
+        super().__init__(f'{name} is not loaded: {reason}')
+        self.name = name
+        self.attr = attr
+        self.reason = reason
+
+
+class DisabledDevice:
+    """Placeholder for a device that was deliberately not loaded.
+
+    Keeps the name importable (plans and scripts that mention the device
+    still load) but any use of it raises a DeviceNotLoadedError with
+    ``reason``.
+    """
+
+    def __init__(self, name, reason):
+        self.name = name
+        self.reason = reason
+
+    def __getattr__(self, attr):
+        raise DeviceNotLoadedError(self.name, attr, self.reason)
+
+    def __repr__(self):
+        return f'<DisabledDevice {self.name!r} ({self.reason})>'
+
+
+class DeviceRegistry:
+    """Catalogue of devices that are built on first use.
+
+    Devices are declared with :meth:`lazy`, which returns a
+    :class:`LazyDevice` to bind in the startup namespace::
+
+        cam_fs = registry.lazy(StandardCam, 'XF:23IDA-BI:1{FS:1-Cam:1}',
+                               name='cam_fs', setup=[_setup_stats])
+
+    Configuration that has to touch the real device (kinds, read_attrs,
+    hints ...) goes into ``setup`` callables or :meth:`configure` hooks so
+    that declaring the device does not build it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._specs = OrderedDict()
+        self._proxies = OrderedDict()
+        self._devices = OrderedDict()
+        self._building = set()
+        self._disabled = OrderedDict()
+        # name -> seconds spent building the device and running its setup
+        self.build_times = OrderedDict()
+
+    def lazy(self, factory, *args, name, setup=(), **kwargs):
+        """Declare a device without building it.
+
+        Parameters
+        ----------
+        factory : callable
+            Usually the device class; called as
+            ``factory(*args, name=name, **kwargs)`` on first use.
+        name : str
+            Device name; also the key in this registry.
+        setup : iterable of callables, optional
+            Each is called with the freshly built device, in order.
+
+        Returns
+        -------
+        LazyDevice
+        """
+        with self._lock:
+            if name in self._specs:
+                raise ValueError(f'A device named {name!r} is already registered.')
+            self._specs[name] = (factory, args, kwargs, list(setup))
+            proxy = self._proxies[name] = LazyDevice(self, name)
+        return proxy
+
+    def disable(self, name, reason):
+        """Declare that the device ``name`` is not loaded in this session.
+
+        Returns
+        -------
+        DisabledDevice
+        """
+        with self._lock:
+            if name in self._specs:
+                raise ValueError(f'A device named {name!r} is already registered.')
+            proxy = self._disabled[name] = DisabledDevice(name, reason)
+        return proxy
+
+    def is_disabled(self, name):
+        return name in self._disabled
+
+    def configure(self, name, func=None):
+        """Run ``func(device)`` once the named device is built.
+
+        If it has already been built ``func`` is called right away; if it
+        was disabled with :meth:`disable` it is never called.  Can be used
+        as a decorator::
+
+            @registry.configure('fccd')
+            def _hint_fccd_stats(fccd):
+                ...
+        """
+        if func is None:
+            return lambda func: self.configure(name, func)
+        if name in self._disabled:
+            return func
+        with self._lock:
+            device = self._devices.get(name)
+            if device is None:
+                self._specs[name][3].append(func)
+        if device is not None:
+            func(device)
+        return func
+
+    def materialize(self, name):
+        "Build (if needed) and return the real device registered as ``name``."
+        device = self._devices.get(name)
+        if device is not None:
+            return device
+        with self._lock:
+            device = self._devices.get(name)
+            if device is not None:
+                return device
+            if name in self._building:
+                raise RuntimeError(f'{name!r} was used by its own setup before '
+                                   'it finished building. Setup functions '
+                                   'must use the device they are passed.')
+            factory, args, kwargs, setup = self._specs[name]
+            self._building.add(name)
+            try:
+                start = ttime.monotonic()
+                device = factory(*args, name=name, **kwargs)
+                for func in setup:
+                    func(device)
+                self.build_times[name] = ttime.monotonic() - start
+            finally:
+                self._building.discard(name)
+            self._devices[name] = device
+            object.__setattr__(self._proxies[name], '_lazy_device', device)
+        logger.debug('Built %s in %.3f s', name, self.build_times[name])
+        return device
+
+    def is_built(self, name):
+        return name in self._devices
+
+    def built(self):
+        "The devices that have been built so far, in registration order."
+        return [self._devices[name] for name in self._specs
+                if name in self._devices]
+
+    def __getitem__(self, name):
+        return self.materialize(name)
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def __iter__(self):
+        return iter(list(self._specs))
+
+    def __len__(self):
+        return len(self._specs)
@@ -1,7 +1,10 @@
-from ophyd import Device
+from ophyd import Device, Kind
 from ophyd.device import Component as Cpt
 from ophyd.device import DynamicDeviceComponent as DDCpt
 from ophyd import EpicsSignal, EpicsSignalRO, OrderedDict
+from ophyd.status import SubscriptionStatus, wait as status_wait
+import numpy as np
+import time as ttime
 
 def _scaler_fields(attr_base, field_base, range_, **kwargs):
     defn = OrderedDict()
@@ -13,7 +16,20 @@ def _scaler_fields(attr_base, field_base, range_, **kwargs):
     return defn
 
 class PrototypeEpicsScaler(Device):
-    '''SynApps Scaler Record interface'''
+    '''SynApps Scaler Record interface
+
+    The per-channel PVs (counts, names, presets, gates) are lazy: only the
+    channels in ``active_channels`` are connected, read and reported in the
+    configuration.  Change the set with :meth:`set_active_channels`.
+
+    Parameters
+    ----------
+    active_channels : iterable of int, optional
+        Channel numbers (1-32) to use, all of them by default.
+    channel_names : str, optional
+        Format for the names of the count signals, e.g. ``'sclr_ch{}'``;
+        they keep the ophyd default names if not given.
+    '''
 
     # tigger + trigger mode
     count = Cpt(EpicsSignal, '.CNT', trigger_value=1)
@@ -24,8 +40,8 @@ class PrototypeEpicsScaler(Device):
     auto_count_delay = Cpt(EpicsSignal, '.DLY1')
 
     # the data
-    channels = DDCpt(_scaler_fields('chan', '.S', range(1, 33)))
-    names = DDCpt(_scaler_fields('name', '.NM', range(1, 33)))
+    channels = DDCpt(_scaler_fields('chan', '.S', range(1, 33), lazy=True))
+    names = DDCpt(_scaler_fields('name', '.NM', range(1, 33), lazy=True))
 
     time = Cpt(EpicsSignal, '.T')
     freq = Cpt(EpicsSignal, '.FREQ')
@@ -33,8 +49,8 @@ class PrototypeEpicsScaler(Device):
     preset_time = Cpt(EpicsSignal, '.TP')
     auto_count_time = Cpt(EpicsSignal, '.TP1')
 
-    presets = DDCpt(_scaler_fields('preset', '.PR', range(1, 33)))
-    gates = DDCpt(_scaler_fields('gate', '.G', range(1, 33)))
+    presets = DDCpt(_scaler_fields('preset', '.PR', range(1, 33), lazy=True))
+    gates = DDCpt(_scaler_fields('gate', '.G', range(1, 33), lazy=True))
 
     update_rate = Cpt(EpicsSignal, '.RATE')
     auto_count_update_rate = Cpt(EpicsSignal, '.RAT1')
@@ -42,7 +58,8 @@ class PrototypeEpicsScaler(Device):
     egu = Cpt(EpicsSignal, '.EGU')
 
     def __init__(self, prefix, *, read_attrs=None, configuration_attrs=None,
-                 name=None, parent=None, **kwargs):
+                 name=None, parent=None, active_channels=None,
+                 channel_names=None, **kwargs):
         if read_attrs is None:
             read_attrs = ['channels', 'time']
 
@@ -57,6 +74,37 @@ class PrototypeEpicsScaler(Device):
                          name=name, parent=parent, **kwargs)
 
         self.stage_sigs.update([(self.count_mode, 0)])
+        self.channel_names = channel_names
+        self.set_active_channels(range(1, 33) if active_channels is None
+                                 else active_channels)
+
+    def set_active_channels(self, channels):
+        """Only read (and connect) the channels numbered in ``channels``.
+
+        Channels dropped from the set keep their connections if they were
+        already made, but are no longer read or described.  Hinted channels
+        that stay active stay hinted.
+        """
+        channels = sorted(set(channels))
+        bad = [i for i in channels if not 1 <= i <= 32]
+        if bad:
+            raise ValueError(f'{self.name}: no scaler channels {bad}, '
+                             f'only 1-32')
+        # (walk_signals skips the channels that were never created)
+        hinted = [walk.dotted_name for walk in self.channels.walk_signals()
+                  if walk.item.kind == Kind.hinted]
+        self.active_channels = channels
+        self.channels.read_attrs = [f'chan{i}' for i in channels]
+        for attr in hinted:
+            if attr in self.channels.read_attrs:
+                getattr(self.channels, attr).kind = 'hinted'
+        for block, base in ((self.names, 'name'), (self.presets, 'preset'),
+                            (self.gates, 'gate')):
+            block.read_attrs = []
+            block.configuration_attrs = [f'{base}{i}' for i in channels]
+        if self.channel_names is not None:
+            for i in channels:
+                getattr(self.channels, f'chan{i}').name = self.channel_names.format(i)
 
 
 def _mcs_fields(cls, attr_base, pv_base, nrange, field, **kwargs):
@@ -70,6 +118,25 @@ def _mcs_fields(cls, attr_base, pv_base, nrange, field, **kwargs):
 
 
 class StruckSIS3820MCS(Device):
+    """SIS3820 multi-channel scaler.
+
+    As a step-scan detector (e.g. inside the FastCCD) every ``read()``
+    advances one bin and reads the waveforms.  It is also a flyer: with
+    hardware channel advance it fills ``fly_bins`` bins on its own during a
+    continuous motion or energy ramp, and ``collect()`` hands all of them
+    over at the end, which the RunEngine packs into a single event page::
+
+        mcs.fly_bins = 5000
+        RE(bpp.fly_during_wrapper(E_ramp([], 700, 720, 0.1), [mcs]))
+
+    Only the waveforms of ``active_channels`` are read out (and connected)
+    in either mode; change them with :meth:`set_active_channels`.
+
+    Parameters
+    ----------
+    active_channels : iterable of int, optional
+        Channel numbers (1-32) to use, all of them by default.
+    """
     _default_configuration_attrs = ('input_mode', 'output_mode',
                                     'output_polarity', 'channel_advance',
                                     'count_on_start', 'max_channels')
@@ -99,28 +166,213 @@ class StruckSIS3820MCS(Device):
 
     current_channel = Cpt(EpicsSignalRO, 'CurrentChannel')
 
+    # lazy and omitted until set_active_channels() makes them normal, so
+    # read_attrs, read() and describe() never build the unused channels
     wfrm = DDCpt(_mcs_fields(EpicsSignalRO,
-                           'wfrm', 'Wfrm:', range(1, 33), ''))
+                           'wfrm', 'Wfrm:', range(1, 33), '',
+                           kind='omitted', lazy=True))
     wfrm_proc = DDCpt(_mcs_fields(EpicsSignal,
                                 'wfrm_proc', 'Wfrm:', range(1, 33), '.PROC',
-                                put_complete=True))
+                                put_complete=True, lazy=True))
+
+    # seconds to wait for the processed waveforms to arrive
+    readout_timeout = 5
+
+    # flying: bins to acquire (None: MaxChannels) and the stream they go to
+    fly_bins = None
+    fly_stream = 'mcs'
 
     def trigger(self):
         self.erase_start.put(1)
         return super().trigger()
 
+    def _watch_wfrms(self, attrs):
+        """Keep a monitor on each waveform in `attrs`, once per session.
+
+        Returns when every one of them has had its first (current) value,
+        so the initial update of a new monitor is never taken for new data.
+        """
+        statuses = []
+        for attr in attrs:
+            if attr in self._wfrm_last:
+                continue
+            sig = getattr(self.wfrm, attr)
+
+            def update(*, timestamp, _attr=attr, **kwargs):
+                self._wfrm_last[_attr] = timestamp
+
+            self._wfrm_last[attr] = None
+            sig.subscribe(update)
+            statuses.append(SubscriptionStatus(sig, lambda **kwargs: True,
+                                               timeout=self.readout_timeout))
+        for st in statuses:
+            status_wait(st)
+
+    def _read_wfrms(self):
+        """Process the waveforms in read_attrs and return their readings.
+
+        All the PROC puts go out at once; the new values come from the
+        monitor updates that processing the records posts, so there is no
+        put-complete round trip per channel and no second get.  Only updates
+        newer (by IOC timestamp) than the last one before the puts count.
+        """
+        attrs = self._wfrm_attrs()
+        self._watch_wfrms(attrs)
+        readings = OrderedDict()
+        statuses = []
+        for attr in attrs:
+            sig = getattr(self.wfrm, attr)
+
+            def arrived(*, value, timestamp, obj, _before=self._wfrm_last[attr],
+                        **kwargs):
+                if _before is not None and timestamp <= _before:
+                    return False
+                readings[obj.name] = {'value': value, 'timestamp': timestamp}
+                return True
+
+            statuses.append(SubscriptionStatus(sig, arrived, run=False,
+                                               timeout=self.readout_timeout))
+        for attr in attrs:
+            proc = getattr(self.wfrm_proc, attr.replace('wfrm', 'wfrm_proc'))
+            proc.put(1, use_complete=False)
+        for st in statuses:
+            status_wait(st)
+        # back in read_attrs order
+        return OrderedDict((getattr(self.wfrm, attr).name,
+                            readings[getattr(self.wfrm, attr).name])
+                           for attr in attrs)
+
+    def stage(self):
+        staged = super().stage()
+        # monitors up before the first point, not during it
+        self._watch_wfrms(self._wfrm_attrs())
+        return staged
+
     def read(self):
-        # Here we stop and poke the proc fields
+        # Here we stop and poke the proc fields (advance before stop, so
+        # these two stay in order)
         self.soft_channel_advance.put(1, wait=True)
         self.stop_all.put(1, wait=True)
 
-        for sn in self.wfrm_proc.component_names:
-            getattr(self.wfrm_proc, sn).put(1)
-
-        return super().read()
-
-    def __init__(self, *args, **kwargs):
+        res = OrderedDict()
+        for attr in self.read_attrs:
+            if '.' not in attr and attr != 'wfrm':
+                res.update(getattr(self, attr).read())
+        res.update(self._read_wfrms())
+        return res
+
+    def set_active_channels(self, channels):
+        """Only read (and connect) the waveforms numbered in ``channels``.
+
+        Waveforms dropped from the set keep their connections if they were
+        already made, but are no longer read or described.
+        """
+        channels = sorted(set(channels))
+        bad = [i for i in channels if not 1 <= i <= 32]
+        if bad:
+            raise ValueError(f'{self.name}: no MCS channels {bad}, only 1-32')
+        self.active_channels = channels
+        # (the setter only changes kinds, it does not build anything)
+        self.wfrm.read_attrs = [f'wfrm_{i}' for i in channels]
+
+    def _wfrm_attrs(self):
+        return [attr.partition('.')[2] for attr in self.read_attrs
+                if attr.startswith('wfrm.')]
+
+    def kickoff(self):
+        """Arm for hardware channel advance; done once it is acquiring.
+
+        The settings changed here are put back after `collect` (or `stop`),
+        flyers are not staged.
+        """
+        self._fly_saved = OrderedDict(
+            (sig, sig.get()) for sig in (self.channel_advance,
+                                         self.count_on_start, self.n_use_all))
+        # external channel advance, first bin on the first pulse
+        self.channel_advance.put(1, wait=True)
+        self.count_on_start.put(0, wait=True)
+        if self.fly_bins is not None:
+            self.n_use_all.put(self.fly_bins, wait=True)
+        self._fly_times = [ttime.time(), None]
+        self.erase_start.put(1)
+        return SubscriptionStatus(self.acquiring,
+                                  lambda *, value, **kwargs: value == 1,
+                                  timeout=self.readout_timeout)
+
+    def complete(self):
+        """Stop acquiring; done when the MCS reports it has stopped.
+
+        Called once the motion is over, so bins that are still empty would
+        never fill: the MCS is stopped here rather than waited for.
+        """
+        def stopped(*, value, **kwargs):
+            if value == 0:
+                self._fly_times[1] = ttime.time()
+                return True
+            return False
+
+        status = SubscriptionStatus(self.acquiring, stopped,
+                                    timeout=self.readout_timeout)
+        self.stop_all.put(1, use_complete=False)
+        return status
+
+    def _restore_fly_settings(self):
+        saved, self._fly_saved = self._fly_saved, None
+        for sig, value in (saved or {}).items():
+            sig.put(value, wait=True)
+
+    def stop(self, *, success=False):
+        # only while flying; as part of the FastCCD nothing changes here
+        if self._fly_saved is not None:
+            self.stop_all.put(1, use_complete=False)
+            self._restore_fly_settings()
+        super().stop(success=success)
+
+    def describe_collect(self):
+        # the stream-nested form, which goes with collect() (the flat one
+        # needs the plan to declare the stream first)
+        desc = OrderedDict()
+        for attr in self._wfrm_attrs():
+            sig = getattr(self.wfrm, attr)
+            desc[sig.name] = {'source': f'PV:{sig.pvname}',
+                              'dtype': 'number', 'shape': []}
+        return {self.fly_stream: desc}
+
+    def collect(self):
+        """All the bins of the last fly, one event per bin.
+
+        The RunEngine bundles what a flyer collects into event pages (one per
+        stream), so the documents are columnar all the same.  The MCS does
+        not time-stamp its bins; they are spread evenly between kickoff and
+        the end of acquisition.
+        """
+        start, stop = self._fly_times
+        if start is None:
+            return
+        n = int(self.current_channel.get())
+        try:
+            readings = self._read_wfrms()
+        finally:
+            self._restore_fly_settings()
+        if not n or not readings:
+            return
+        times = np.linspace(start, stop or ttime.time(), n).tolist()
+        columns = {key: np.asarray(r['value'])[:n].tolist()
+                   for key, r in readings.items()}
+        for i, t in enumerate(times):
+            yield {'time': t,
+                   'data': {key: v[i] for key, v in columns.items()},
+                   'timestamps': {key: t for key in columns}}
+
+    def __init__(self, *args, active_channels=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.set_active_channels(range(1, 33) if active_channels is None
+                                 else active_channels)
+        self._fly_times = [None, None]
+        # settings kickoff changed, put back after the fly
+        self._fly_saved = None
+        # wfrm attr -> IOC timestamp of its last monitor update
+        self._wfrm_last = {}
         self.stage_sigs['input_mode'] = 3
         self.stage_sigs['acquire_mode'] = 0
         self.stage_sigs['count_on_start'] = 0
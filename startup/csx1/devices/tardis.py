@@ -0,0 +1,71 @@
+from ophyd import Component as Cpt
+from ophyd import (PseudoSingle, EpicsMotor, SoftPositioner)
+import gi
+gi.require_version('Hkl', '5.0')
+try:
+    from hkl.diffract import E6C  #this works for mu=0
+except ImportError:
+    # The class was moved to hkl.geometries module in recent hklpy v0.3.16.
+    from hkl.geometries import E6C
+from ophyd.pseudopos import (pseudo_position_argument, real_position_argument)
+
+# Importing this module loads hkl and gi, which is slow; csx1.startup.tardis
+# only does it when the tardis is first used.
+
+
+# TODO: fix upstream!!
+class NullMotor(SoftPositioner):
+    @property
+    def connected(self):
+        return True
+
+
+class AxisCpt(Cpt):
+    """A real axis that can be a motor built beforehand.
+
+    theta, delta and gamma exist as plain motors long before the tardis is
+    built (see csx1.startup.tardis); passed as ``Tardis(..., axes={'theta':
+    theta, ...})`` they become its components, rather than a second set of
+    motors on the same PVs.  Axes not passed are built as usual.
+    """
+    def create_component(self, instance):
+        motor = instance._adopted_axes.get(self.attr)
+        if motor is None:
+            return super().create_component(instance)
+        return motor
+
+
+class Tardis(E6C):  #this works for mu=0
+    h = Cpt(PseudoSingle, '', labels=['tardis'])
+    k = Cpt(PseudoSingle, '', labels=['tardis'])
+    l = Cpt(PseudoSingle, '', labels=['tardis'])
+
+    theta = AxisCpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Th}Mtr', labels=['tardis'])
+    mu = Cpt(NullMotor, labels=['tardis'])
+
+    chi =   Cpt(NullMotor, labels=['tardis'])
+    phi =   Cpt(NullMotor, labels=['tardis'])
+    delta = AxisCpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Del}Mtr', labels=['tardis'])
+    gamma = AxisCpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Gam}Mtr', labels=['tardis'])
+
+
+    def __init__(self, *args, muR, axes=None, **kwargs):
+        # before super().__init__, which builds the components
+        self._adopted_axes = dict(axes or {})
+        super().__init__(*args, **kwargs)
+
+        # prime the 3 null-motors with initial values
+        # otherwise, position == None --> describe, etc gets borked
+        self.chi.move(0.0)
+        self.phi.move(0.0)
+
+        # we have to use a motor for omega to keep hkl happy,
+        # but want to keep omega as read-only and to follow muR
+        def muR_updater(value, **kwargs):
+            self.mu.move(value)
+
+        muR.subscribe(muR_updater)
+
+    @pseudo_position_argument
+    def set(self, position):
+        return super().set([float(_) for _ in position])
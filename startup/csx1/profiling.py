@@ -0,0 +1,203 @@
+"""Opt-in instrumentation of the profile startup.
+
+Set ``CSX_PROFILE_STARTUP`` before launching bsui to record, for every
+startup file and for every module imported while they run, the wall time
+and the change in resident memory, and write it all to a JSON report::
+
+    CSX_PROFILE_STARTUP=/tmp/startup.json ipython --profile=collection
+
+``CSX_PROFILE_STARTUP=1`` writes to ``~/.cache/csx1/startup-profile.json``.
+The report is rewritten after each startup file, so it is complete once
+the prompt appears.  Per-device construction times come from the device
+registry (see :mod:`csx1.devices.registry`).
+
+This module must stay importable without importing ``csx1.startup``.
+"""
+import builtins
+import json
+import os
+import socket
+import sys
+import time as ttime
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+DEFAULT_REPORT_PATH = os.path.expanduser('~/.cache/csx1/startup-profile.json')
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def current_rss():
+    "Resident set size of this process in bytes."
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+        # Peak rather than current, but all that is available off Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StartupProfiler:
+    """Collects per-file, per-module and per-device startup costs."""
+
+    def __init__(self):
+        self.path = None
+        self.files = OrderedDict()
+        self.sections = OrderedDict()
+        self.imports = OrderedDict()
+        self.devices = OrderedDict()
+        self._open = {}
+        self._import_stack = []
+        self._orig_import = None
+        self._t0 = None
+
+    @property
+    def enabled(self):
+        return self._t0 is not None
+
+    def start(self, ip, path=None, *, current_file=None):
+        """Begin profiling.
+
+        Parameters
+        ----------
+        ip : IPython.core.interactiveshell.InteractiveShell
+            Its ``safe_execfile`` is wrapped to time the remaining startup
+            files.
+        path : str, optional
+            Where to write the JSON report.
+        current_file : str, optional
+            The startup file calling this; close it with :meth:`end`.
+        """
+        if self.enabled:
+            return
+        self.path = path or DEFAULT_REPORT_PATH
+        self._t0 = ttime.monotonic()
+        self._install_import_hook()
+        self._wrap_execfile(ip)
+        if current_file is not None:
+            self.begin(current_file)
+
+    def begin(self, name):
+        self._open[name] = (ttime.monotonic(), current_rss())
+
+    def end(self, name, *, into=None):
+        t0, rss0 = self._open.pop(name)
+        (self.files if into is None else into)[name] = {
+            'start': t0 - self._t0,
+            'wall': ttime.monotonic() - t0,
+            'rss_delta': current_rss() - rss0,
+        }
+        self.write()
+
+    @contextmanager
+    def section(self, name):
+        "Time an arbitrary block, e.g. the connection phase."
+        if not self.enabled:
+            yield
+            return
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name, into=self.sections)
+
+    def _wrap_execfile(self, ip):
+        orig = ip.safe_execfile
+
+        def timed_execfile(fname, *args, **kwargs):
+            name = os.path.basename(fname)
+            self.begin(name)
+            try:
+                return orig(fname, *args, **kwargs)
+            finally:
+                self.end(name)
+
+        ip.safe_execfile = timed_execfile
+
+    def _install_import_hook(self):
+        self._orig_import = orig = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level:
+                package = (globals or {}).get('__package__') or ''
+                bits = package.rsplit('.', level - 1)
+                absname = f'{bits[0]}.{name}' if name else bits[0]
+            else:
+                absname = name
+            if absname in sys.modules:
+                return orig(name, globals, locals, fromlist, level)
+            frame = [absname, ttime.monotonic(), current_rss(), 0.0]
+            self._import_stack.append(frame)
+            try:
+                return orig(name, globals, locals, fromlist, level)
+            finally:
+                self._import_stack.pop()
+                wall = ttime.monotonic() - frame[1]
+                if self._import_stack:
+                    self._import_stack[-1][3] += wall
+                self.imports.setdefault(absname, {
+                    'wall': wall,
+                    'self': wall - frame[3],
+                    'rss_delta': current_rss() - frame[2],
+                })
+
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        if self._orig_import is not None:
+            builtins.__import__ = self._orig_import
+            self._orig_import = None
+
+    def track_devices(self, build_times):
+        """Report per-device construction times from ``build_times``.
+
+        Pass ``registry.build_times``; devices built later (on first use, or
+        by the benchmark) show up in the next :meth:`write`.
+        """
+        self.devices = build_times
+
+    def report(self, *, min_import_time=0.005):
+        packages = OrderedDict()
+        for name, entry in self.imports.items():
+            top = name.partition('.')[0]
+            packages[top] = packages.get(top, 0.0) + entry['self']
+        imports = OrderedDict(
+            (name, entry) for name, entry in self.imports.items()
+            if entry['wall'] >= min_import_time or name.startswith('csx1'))
+        return {
+            'host': socket.gethostname(),
+            'python': sys.version.split()[0],
+            'total_wall': ttime.monotonic() - self._t0 if self.enabled else 0.0,
+            'rss': current_rss(),
+            'files': self.files,
+            'sections': self.sections,
+            'packages': OrderedDict(sorted(packages.items(),
+                                           key=lambda kv: -kv[1])),
+            'imports': imports,
+            'devices': self.devices,
+        }
+
+    def write(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+profiler = StartupProfiler()
+
+
+def start_from_environment(ip, current_file):
+    """Start :data:`profiler` if ``CSX_PROFILE_STARTUP`` is set."""
+    value = os.environ.get('CSX_PROFILE_STARTUP', '')
+    if value in ('', '0'):
+        return profiler
+    profiler.start(ip, None if value == '1' else value, current_file=current_file)
+    return profiler
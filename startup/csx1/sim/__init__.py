@@ -0,0 +1,116 @@
+"""Simulated beamline mode for the profile.
+
+``CSX_SIMULATION`` selects it before any PV is created:
+
+``CSX_SIMULATION=1``
+    start the soft IOC of :mod:`csx1.sim.ioc` in a subprocess on this
+    machine and point channel access at it only.
+``CSX_SIMULATION=host:port``
+    use a simulation IOC that is already running elsewhere, e.g. one
+    started by hand with ``python -m csx1.sim``.
+
+In either case the profile also skips kafka, olog and the beamline
+databroker (see ``00-nsls2-tools.py``).  ``CSX_OFFLINE=1`` does only that,
+without a simulation IOC (the startup benchmark uses it with ophyd's dummy
+control layer).  Nothing here imports caproto, the IOC has its own process.
+"""
+import atexit
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time as ttime
+
+
+DEFAULT_PORT = 5074
+
+
+def simulation_mode():
+    "None, 'local' or the 'host:port' of an external simulation IOC."
+    value = os.environ.get('CSX_SIMULATION', '')
+    if value in ('', '0'):
+        return None
+    if value == '1':
+        return 'local'
+    return value
+
+
+def offline_mode():
+    "Whether to leave out kafka, olog and the beamline databroker."
+    return (simulation_mode() is not None
+            or os.environ.get('CSX_OFFLINE', '') not in ('', '0'))
+
+
+def use_ioc(address):
+    """Point channel access at the IOC at ``address`` ('host:port') only.
+
+    Has to happen before the first PV is created, the CA libraries read the
+    environment once.
+    """
+    os.environ['EPICS_CA_AUTO_ADDR_LIST'] = 'NO'
+    os.environ['EPICS_CA_ADDR_LIST'] = address
+    host, _, port = address.partition(':')
+    if port:
+        os.environ['EPICS_CA_SERVER_PORT'] = port
+
+
+def start_ioc(port=DEFAULT_PORT, *, metadata=None, timeout=20, verbose=False):
+    """Start the simulation IOC in a subprocess and wait until it listens.
+
+    Parameters
+    ----------
+    port : int, optional
+        CA server port; different from 5064 so a real IOC on this machine
+        is never answered by mistake.
+    metadata : str, optional
+        PV metadata cache file to take PV types from.
+    timeout : float, optional
+        Seconds to wait for the IOC to come up.
+
+    Returns
+    -------
+    subprocess.Popen
+        The IOC is terminated when this Python process exits.  Its output
+        goes to ``csx1-sim-ioc-<port>.log`` in the temporary directory.
+    """
+    env = dict(os.environ,
+               EPICS_CA_SERVER_PORT=str(port),
+               EPICS_CAS_INTF_ADDR_LIST='127.0.0.1')
+    cmd = [sys.executable, '-m', 'csx1.sim', '--interfaces', '127.0.0.1']
+    if metadata and os.path.exists(metadata):
+        cmd += ['--metadata', metadata]
+    if verbose:
+        cmd.append('--verbose')
+    startup_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    log_path = os.path.join(tempfile.gettempdir(), f'csx1-sim-ioc-{port}.log')
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(cmd, cwd=startup_dir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    atexit.register(_stop, proc)
+
+    deadline = ttime.monotonic() + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f'The simulation IOC exited with status '
+                               f'{proc.returncode}, see {log_path}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return proc
+        except OSError:
+            if ttime.monotonic() > deadline:
+                _stop(proc)
+                raise TimeoutError(f'The simulation IOC did not start '
+                                   f'listening on port {port} in {timeout} s, '
+                                   f'see {log_path}.')
+            ttime.sleep(0.1)
+
+
+def _stop(proc):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
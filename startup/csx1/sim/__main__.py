@@ -0,0 +1,3 @@
+from .ioc import main
+
+main()
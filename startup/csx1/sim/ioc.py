@@ -0,0 +1,551 @@
+"""A soft IOC impersonating the CSX beamline, built on caproto.
+
+Rather than listing every PV up front, the IOC creates a PV the first time a
+client searches for it, as long as the name falls in one of the beamline
+namespaces (``XF:23ID``, ``SR:``).  The type of the new PV comes from the PV
+metadata cache written on the beamline (see :mod:`csx1.devices.pvcache`)
+when it is available and from naming conventions otherwise, and its
+behaviour from the suffix:
+
+* motor records (``...}Mtr``): moves at ``.VELO``, ``.DMOV``/``.MOVN``
+* ``...-SP`` setpoints: ramp the matching ``-I``/``-RB`` readback, with put
+  completion once there (``PVPositionerPC``: PGM energy, EPU gap/phase ...)
+* ``Foo``/``Foo_RBV`` pairs: the readback follows the setpoint
+* EPS ``Cmd:<state>-Cmd``: ``Pos-Sts`` changes after a short delay
+* area detector ``cam1:Acquire``: frames take ``AcquireTime`` (+ readout),
+  counters, ``NumCaptured_RBV`` of capturing file plugins and the stats
+  plugins update per frame, ``DetectorState_RBV`` follows
+* scaler ``.CNT``: counts for ``.TP`` seconds, then fills ``.S1``-``.S32``
+* Struck MCS: ``EraseStart``/``StopAll``/``Wfrm:N.PROC``
+
+Run it with ``python -m csx1.sim`` (from the startup directory); the profile
+does that itself when ``CSX_SIMULATION=1``, see :mod:`csx1.sim`.
+
+This module only needs caproto and numpy, not ophyd.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time as ttime
+
+import numpy as np
+from caproto import (ChannelChar, ChannelDouble, ChannelEnum, ChannelInteger,
+                     ChannelString)
+from caproto.asyncio.server import run
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIXES = ('XF:23ID', 'SR:')
+
+# Frame readout on top of the exposure, like ProductionCamBase.readout_time.
+READOUT_TIME = 0.04
+# How often moving readbacks are updated.
+MOTION_TICK = 0.05
+# Nothing in the simulation takes longer than this to move.
+MAX_MOVE_TIME = 10.0
+# Units per second for -SP/-RB positioners, by a substring of the PV name.
+POSITIONER_SPEEDS = [('Enrgy', 100.0), ('Gap', 2000.0), ('Phase', 2000.0),
+                     ('T-SP', 1.0), ('', 10.0)]
+
+EPS_STATES = ['Open', 'Closed', 'Inserted', 'Not Inserted']
+# EPS command name (the nm_str of EPSTwoStateDevice) -> resulting state
+EPS_COMMANDS = {'Opn': 'Open', 'Cls': 'Closed',
+                'In': 'Inserted', 'Out': 'Not Inserted'}
+EPS_DELAY = 0.5
+
+NO_YES = ['No', 'Yes']
+DISABLE_ENABLE = ['Disable', 'Enable']
+# Last token of the PV name (without _RBV) -> enum strings
+ENUMS = {
+    'Acquire': ['Done', 'Acquire'],
+    'Capture': ['Done', 'Capture'],
+    'ImageMode': ['Single', 'Multiple', 'Continuous'],
+    'TriggerMode': ['Internal', 'External', 'Sync In 1', 'Sync In 2',
+                    'Sync In 3', 'Sync In 4', 'Fixed Rate', 'Software'],
+    'FileWriteMode': ['Single', 'Capture', 'Stream'],
+    'DetectorState': ['Idle', 'Acquire', 'Readout', 'Correct', 'Saving',
+                      'Aborting', 'Error', 'Waiting', 'Initializing',
+                      'Disconnected', 'Aborted'],
+    'DataType': ['Int8', 'UInt8', 'Int16', 'UInt16', 'Int32', 'UInt32',
+                 'Int64', 'UInt64', 'Float32', 'Float64'],
+    'ColorMode': ['Mono', 'Bayer', 'RGB1', 'RGB2', 'RGB3', 'YUV444',
+                  'YUV422', 'YUV421'],
+    'SWMRMode': ['Off', 'On'],
+    'EnableCallbacks': DISABLE_ENABLE,
+    'ArrayCallbacks': DISABLE_ENABLE,
+    'Enable': DISABLE_ENABLE,
+    'EnableX': DISABLE_ENABLE,
+    'EnableY': DISABLE_ENABLE,
+    'EnableZ': DISABLE_ENABLE,
+    'AutoSave': NO_YES,
+    'AutoIncrement': NO_YES,
+    'FilePathExists': NO_YES,
+    'BlockingCallbacks': NO_YES,
+    'LazyOpen': NO_YES,
+    'WaitForPlugins': NO_YES,
+    'ComputeStatistics': NO_YES,
+    'ComputeCentroid': NO_YES,
+    'ComputeHistogram': NO_YES,
+    'ComputeProfiles': NO_YES,
+    'SWMRSupported': NO_YES,
+    'SWMRActive': NO_YES,
+    'CONT': ['OneShot', 'AutoCount'],
+}
+
+_INT_TOKENS = ('ArrayCounter', 'NumCaptured', 'NumCapture', 'NumImages',
+               'NumExposures', 'ArraySize', 'MaxSize', 'FileNumber', 'NumQueue',
+               'QueueSize', 'DroppedArrays', 'SizeX', 'SizeY', 'MinX', 'MinY',
+               'BinX', 'BinY', 'NDimensions', 'UniqueId', 'SWMRCbCounter',
+               'Acquiring', 'CurrentChannel', 'MaxChannels', 'NUseAll',
+               'EraseStart', 'EraseAll', 'StartAll', 'StopAll', 'ReadAll',
+               'SoftwareChannelAdvance', 'InputMode', 'OutputMode',
+               'OutputPolarity', 'ChannelAdvance', 'CountOnStart',
+               'AcquireMode')
+_INT_FIELDS = ('DMOV', 'MOVN', 'CNT', 'PROC', 'DIR', 'SET', 'FOFF', 'HLS',
+               'LLS', 'TDIR', 'STOP', 'HOMF', 'HOMR', 'MSTA', 'CNEN', 'SPMG',
+               'LVIO', 'RATE', 'RAT1')
+_STRING_TOKENS = ('FilePath', 'FileName', 'FileTemplate', 'FullFileName',
+                  'NDAttributesFile', 'Manufacturer', 'Model', 'SDKVersion',
+                  'FirmwareVersion', 'PortName', 'PluginType', 'NDArrayPort')
+_STRING_FIELDS = re.compile(r'^(NM\d+|EGU|DESC|OUT\$|DOL\$)$')
+
+# Starting values, by last token / field
+DEFAULTS = {
+    'ArraySize0': 1024, 'ArraySize1': 1024, 'MaxSizeX': 1024,
+    'MaxSizeY': 1024, 'SizeX': 1024, 'SizeY': 1024,
+    'AcquireTime': 1.0, 'AcquirePeriod': 1.0, 'NumImages': 1,
+    'NumExposures': 1, 'DataType': 'UInt16', 'FilePathExists': 'Yes',
+    'SWMRSupported': 'Yes', 'FileTemplate': '%s%s_%6.6d.h5',
+    'EnableCallbacks': 'Enable', 'MaxChannels': 8192, 'NUseAll': 100,
+    'TP': 1.0, 'FREQ': 1e7, 'VELO': 1.0, 'ACCL': 0.2, 'DMOV': 1, 'EGU': 'mm',
+}
+SPECIAL = {'XF:23ID-SR{}I-I': 400.0}  # ring current
+
+
+def _token(pvname):
+    "The part of a PV name that says what it is, e.g. 'Acquire' or 'VELO'."
+    record, _, field = pvname.partition('.')
+    if field:
+        return field
+    token = re.split(r'[}:]', record)[-1]
+    if token.endswith('_RBV'):
+        token = token[:-len('_RBV')]
+    return token
+
+
+class _PutHook:
+    "Calls ``on_put(pvname, value)`` for writes coming from clients."
+    def __init__(self, *, pvname, on_put=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pvname = pvname
+        self.on_put = on_put
+
+    async def verify_value(self, value):
+        value = await super().verify_value(value)
+        if self.on_put is not None:
+            new_value = await self.on_put(self.pvname, value)
+            if new_value is not None:
+                value = new_value
+        return value
+
+
+class SimDouble(_PutHook, ChannelDouble):
+    pass
+
+
+class SimInteger(_PutHook, ChannelInteger):
+    pass
+
+
+class SimEnum(_PutHook, ChannelEnum):
+    pass
+
+
+class SimString(_PutHook, ChannelString):
+    pass
+
+
+class SimChar(_PutHook, ChannelChar):
+    pass
+
+
+class SimulatedBeamline(dict):
+    """PV database that creates beamline PVs on demand.
+
+    Parameters
+    ----------
+    prefixes : tuple of str
+        Only names starting with one of these are served.
+    metadata : dict, optional
+        Contents of ``pvs`` in a PV metadata cache file; used for types,
+        shapes, enum strings, units and limits.
+    """
+    def __init__(self, prefixes=DEFAULT_PREFIXES, metadata=None):
+        super().__init__()
+        self.prefixes = tuple(prefixes)
+        self.metadata = metadata or {}
+        self._tasks = {}
+        self._rng = np.random.default_rng()
+
+    def __missing__(self, pvname):
+        if not pvname.startswith(self.prefixes):
+            raise KeyError(pvname)
+        record, _, field = pvname.partition('.')
+        if field == 'VAL':
+            channel = self[record]
+        else:
+            channel = self._make(pvname)
+        self[pvname] = channel
+        logger.debug('Created %s as %s', pvname, type(channel).__name__)
+        return channel
+
+    def peek(self, pvname):
+        "The channel for ``pvname`` if a client has asked for it already."
+        return dict.get(self, pvname)
+
+    def get_value(self, pvname, default=None):
+        "Current value of ``pvname``, creating it if needed."
+        try:
+            return self[pvname].value
+        except KeyError:
+            return default
+
+    async def put(self, pvname, value):
+        "Write from inside the simulation (client hooks are not called)."
+        try:
+            channel = self[pvname]
+        except KeyError:
+            return
+        if isinstance(channel, ChannelEnum) and not isinstance(value, str):
+            value = channel.enum_strings[int(value)]
+        await channel.write(value, verify_value=False)
+
+    async def put_if_used(self, pvname, value):
+        "Like :meth:`put`, but only for PVs some client has connected to."
+        if self.peek(pvname) is not None:
+            await self.put(pvname, value)
+
+    def spawn(self, key, coro):
+        "Run ``coro`` in the background, replacing any task under ``key``."
+        previous = self._tasks.pop(key, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+        self._tasks[key] = task = asyncio.ensure_future(coro)
+        return task
+
+    def cancel(self, key):
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    # Building channels
+
+    def _make(self, pvname):
+        token = _token(pvname)
+        kwargs = {'pvname': pvname, 'on_put': self._behaviour(pvname, token)}
+        entry = self._metadata_for(pvname)
+        if entry is not None:
+            return self._from_metadata(pvname, token, entry, kwargs)
+
+        if pvname in SPECIAL:
+            return SimDouble(value=SPECIAL[pvname], precision=3, **kwargs)
+        default = DEFAULTS.get(token)
+        if pvname.endswith('Pos-Sts') or pvname.endswith('}Pos-Sts'):
+            return SimEnum(value=self._eps_initial(pvname),
+                           enum_strings=EPS_STATES, **kwargs)
+        if pvname.endswith('-Cmd'):
+            return SimEnum(value='None', enum_strings=['None', 'Cmd'], **kwargs)
+        if token in ENUMS:
+            strings = ENUMS[token]
+            return SimEnum(value=default if default in strings else strings[0],
+                           enum_strings=strings, **kwargs)
+        if token in _STRING_TOKENS:
+            return SimChar(value=default or '', max_length=256,
+                           string_encoding='latin-1', **kwargs)
+        if (_STRING_FIELDS.match(token) or pvname.endswith('-Sts')
+                or pvname.endswith('-Sel')):
+            return SimString(value=default or '', **kwargs)
+        if token == 'ArrayData':
+            return SimInteger(value=np.zeros(512 * 512, dtype=np.int32),
+                              max_length=512 * 512, **kwargs)
+        if re.match(r'^\d+$', token) and 'Wfrm:' in pvname:
+            n = 8192
+            return SimInteger(value=np.zeros(n, dtype=np.int32),
+                              max_length=n, **kwargs)
+        if token in _INT_TOKENS or token in _INT_FIELDS:
+            return SimInteger(value=int(default or 0), **kwargs)
+        return SimDouble(value=float(default or 0.0), precision=3, **kwargs)
+
+    def _metadata_for(self, pvname):
+        for key in (pvname, pvname + '|string'):
+            if key in self.metadata:
+                return self.metadata[key]
+        return None
+
+    def _from_metadata(self, pvname, token, entry, kwargs):
+        enum_strs = entry.get('enum_strs')
+        shape = entry.get('shape') or []
+        dtype = entry.get('dtype')
+        limits = {'lower_ctrl_limit': entry.get('lower_ctrl_limit') or 0,
+                  'upper_ctrl_limit': entry.get('upper_ctrl_limit') or 0,
+                  'units': entry.get('units') or ''}
+        if enum_strs:
+            return SimEnum(value=enum_strs[0], enum_strings=list(enum_strs),
+                           **kwargs)
+        if dtype == 'string':
+            if token in _STRING_TOKENS:
+                return SimChar(value='', max_length=256,
+                               string_encoding='latin-1', **kwargs)
+            return SimString(value='', **kwargs)
+        if dtype == 'array':
+            n = int(np.prod(shape)) if shape else 1
+            return SimDouble(value=np.zeros(n), max_length=n, **limits,
+                             **kwargs)
+        if dtype == 'integer':
+            return SimInteger(value=int(DEFAULTS.get(token, 0)), **limits,
+                              **kwargs)
+        return SimDouble(value=float(SPECIAL.get(pvname, DEFAULTS.get(token, 0.0))),
+                         precision=entry.get('precision') or 3, **limits,
+                         **kwargs)
+
+    def _eps_initial(self, pvname):
+        # Shutters and valves start closed, everything else retracted.
+        if re.search(r'Sh|GV', pvname):
+            return 'Closed'
+        return 'Not Inserted'
+
+    # Behaviours
+
+    def _behaviour(self, pvname, token):
+        record, _, field = pvname.partition('.')
+        if record.endswith('Mtr'):
+            if field in ('', 'VAL'):
+                return self._motor_move
+            if field == 'STOP':
+                return self._motor_stop
+            return None
+        if re.search(r'\}Cmd:(Opn|Cls|In|Out)-Cmd$', pvname):
+            return self._eps_command
+        if field == 'CNT':
+            return self._scaler_count
+        if 'Wfrm:' in pvname and field == 'PROC':
+            return self._mcs_process
+        if token in ('EraseStart', 'StopAll', 'SoftwareChannelAdvance'):
+            return self._mcs_command
+        if pvname.endswith('cam1:Acquire'):
+            return self._acquire
+        if token == 'Capture' and not pvname.endswith('_RBV'):
+            return self._capture
+        if pvname.endswith('-SP'):
+            return self._positioner_move
+        if not pvname.endswith('_RBV') and not field:
+            return self._mirror_rbv
+        return None
+
+    async def _mirror_rbv(self, pvname, value):
+        await self.put_if_used(pvname + '_RBV', value)
+
+    # Motor records
+
+    async def _motor_move(self, record, target):
+        self.spawn(record, self._motor_motion(record, float(target)))
+
+    async def _motor_motion(self, record, target):
+        start = float(self.get_value(record + '.RBV', 0.0))
+        velocity = abs(float(self.get_value(record + '.VELO', 1.0))) or 1.0
+        accel = float(self.get_value(record + '.ACCL', 0.2))
+        duration = min(abs(target - start) / velocity + accel, MAX_MOVE_TIME)
+        await self.put(record + '.DMOV', 0)
+        await self.put_if_used(record + '.MOVN', 1)
+        await self.put_if_used(record + '.TDIR', int(target >= start))
+        try:
+            await self._ramp(record + '.RBV', start, target, duration)
+        finally:
+            await self.put_if_used(record + '.MOVN', 0)
+            await self.put(record + '.DMOV', 1)
+
+    async def _motor_stop(self, pvname, value):
+        if value:
+            record = pvname.partition('.')[0]
+            self.cancel(record)
+            await self.put(record, self.get_value(record + '.RBV', 0.0))
+        return 0
+
+    async def _ramp(self, pvname, start, target, duration):
+        t0 = ttime.monotonic()
+        while True:
+            fraction = (ttime.monotonic() - t0) / duration if duration else 1
+            if fraction >= 1:
+                break
+            await self.put(pvname, start + (target - start) * fraction)
+            await asyncio.sleep(MOTION_TICK)
+        await self.put(pvname, target)
+
+    # -SP / -RB positioners
+
+    async def _positioner_move(self, setpoint, target):
+        stem = setpoint[:-len('-SP')]
+        speed = next(s for key, s in POSITIONER_SPEEDS if key in setpoint)
+        readbacks = [stem + suffix for suffix in ('-I', '-RB')
+                     if self.peek(stem + suffix) is not None]
+        for readback in readbacks:
+            start = float(self.get_value(readback, 0.0))
+            duration = min(abs(float(target) - start) / speed, MAX_MOVE_TIME)
+            # Awaited so that the put completes when the move is done.
+            await self._ramp(readback, start, float(target), duration)
+
+    # EPS two state devices
+
+    async def _eps_command(self, pvname, value):
+        if value in (0, 'None'):
+            return
+        prefix, name = re.match(r'(.*)Cmd:(\w+)-Cmd$', pvname).groups()
+        state = EPS_COMMANDS.get(name)
+        if state is not None:
+            self.spawn(prefix + 'Pos-Sts', self._eps_move(prefix, pvname, state))
+
+    async def _eps_move(self, prefix, cmd, state):
+        await asyncio.sleep(EPS_DELAY)
+        await self.put(prefix + 'Pos-Sts', state)
+        await self.put(cmd, 'None')
+
+    # Scalers
+
+    async def _scaler_count(self, pvname, value):
+        if not int(value):
+            return
+        record = pvname.partition('.')[0]
+        preset = float(self.get_value(record + '.TP', 1.0)) or 1.0
+        freq = float(self.get_value(record + '.FREQ', 1e7))
+        # Awaited so that the put completes when counting is done, which
+        # is what ophyd waits for when triggering the scaler.
+        await asyncio.sleep(min(preset, MAX_MOVE_TIME))
+        await self.put_if_used(record + '.T', preset)
+        await self.put_if_used(record + '.S1', freq * preset)
+        for i in range(2, 33):
+            await self.put_if_used(f'{record}.S{i}',
+                                   float(self._rng.poisson(1e4 * preset)))
+        return 0
+
+    # Struck SIS3820 MCS
+
+    async def _mcs_command(self, pvname, value):
+        token = _token(pvname)
+        prefix = pvname[:-len(token)]
+        if token == 'EraseStart':
+            await self.put(prefix + 'CurrentChannel', 0)
+            await self.put(prefix + 'Acquiring', 1)
+        elif token == 'SoftwareChannelAdvance':
+            current = int(self.get_value(prefix + 'CurrentChannel', 0))
+            await self.put(prefix + 'CurrentChannel', current + 1)
+        elif token == 'StopAll':
+            await self.put(prefix + 'Acquiring', 0)
+
+    async def _mcs_process(self, pvname, value):
+        waveform = pvname.partition('.')[0]
+        prefix = waveform[:waveform.index('Wfrm:')]
+        n = int(self.get_value(prefix + 'CurrentChannel', 0)) or \
+            int(self.get_value(prefix + 'NUseAll', 100))
+        data = np.zeros(self[waveform].max_length, dtype=np.int32)
+        data[:n] = self._rng.poisson(1e4, n)
+        await self.put(waveform, data)
+        return 0
+
+    # Area detectors
+
+    async def _acquire(self, pvname, value):
+        cam = pvname[:-len('Acquire')]
+        if value in ('Done', 0):
+            self.cancel(cam)
+            await self._acquire_done(cam)
+            return
+        await self.put(cam + 'Acquire_RBV', 'Acquire')
+        self.spawn(cam, self._acquisition(cam))
+
+    async def _acquisition(self, cam):
+        detector = cam[:-len('cam1:')]
+        mode = self.get_value(cam + 'ImageMode', 'Single')
+        frames = {'Single': 1, 'Multiple': int(self.get_value(cam + 'NumImages', 1))}
+        remaining = frames.get(mode)
+        exposure = float(self.get_value(cam + 'AcquireTime', 1.0))
+        period = max(float(self.get_value(cam + 'AcquirePeriod', 0.0)),
+                     exposure + READOUT_TIME)
+        try:
+            while remaining is None or remaining > 0:
+                await self.put_if_used(cam + 'DetectorState_RBV', 'Acquire')
+                await asyncio.sleep(min(exposure, MAX_MOVE_TIME))
+                await self.put_if_used(cam + 'DetectorState_RBV', 'Readout')
+                await asyncio.sleep(min(period - exposure, MAX_MOVE_TIME))
+                await self._new_frame(detector, cam)
+                if remaining is not None:
+                    remaining -= 1
+        finally:
+            if remaining is not None:
+                await self._acquire_done(cam)
+
+    async def _capture(self, pvname, value):
+        if value in ('Capture', 1):
+            await self.put_if_used(pvname[:-len('Capture')] + 'NumCaptured_RBV', 0)
+        await self._mirror_rbv(pvname, value)
+
+    async def _acquire_done(self, cam):
+        await self.put_if_used(cam + 'DetectorState_RBV', 'Idle')
+        await self.put(cam + 'Acquire', 'Done')
+        await self.put(cam + 'Acquire_RBV', 'Done')
+
+    async def _new_frame(self, detector, cam):
+        for pvname in list(self):
+            if not pvname.startswith(detector):
+                continue
+            token = _token(pvname)
+            plugin = pvname[:-len(token) - len('_RBV')]
+            if pvname.endswith('ArrayCounter_RBV'):
+                await self.put(pvname, int(self[pvname].value) + 1)
+            elif pvname.endswith('NumCaptured_RBV'):
+                if self.get_value(plugin + 'Capture_RBV') == 'Capture':
+                    captured = int(self[pvname].value) + 1
+                    await self.put(pvname, captured)
+                    await self.put_if_used(plugin + 'SWMRCbCounter_RBV', captured)
+                    wanted = int(self.get_value(plugin + 'NumCapture_RBV', 0))
+                    if wanted and captured >= wanted:
+                        await self.put(plugin + 'Capture_RBV', 'Done')
+                        await self.put(plugin + 'Capture', 'Done')
+            elif token in ('Total', 'Net'):
+                await self.put(pvname, float(self._rng.normal(1e6, 1e3)))
+            elif token in ('MeanValue', 'MaxValue', 'MinValue', 'Sigma'):
+                await self.put(pvname, float(self._rng.normal(100, 10)))
+
+
+def load_metadata(path):
+    "The per-PV entries of a PV metadata cache file, or {}."
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f).get('pvs', {})
+    except (OSError, ValueError) as err:
+        logger.warning('Not using PV metadata from %s: %r', path, err)
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Soft IOC simulating the CSX beamline PVs.')
+    parser.add_argument('--interfaces', nargs='+', default=['127.0.0.1'])
+    parser.add_argument('--prefixes', nargs='+', default=list(DEFAULT_PREFIXES))
+    parser.add_argument('--metadata',
+                        help='PV metadata cache file (pv-metadata-cache.json) '
+                             'to take PV types from')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    # The port comes from EPICS_CA_SERVER_PORT, as for any caproto IOC.
+    pvdb = SimulatedBeamline(args.prefixes, load_metadata(args.metadata))
+    run(pvdb, interfaces=args.interfaces)
+
+
+if __name__ == '__main__':
+    main()
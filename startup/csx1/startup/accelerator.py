@@ -1,5 +1,6 @@
 from ophyd import EpicsSignalRO
 from ..devices.epu import EPU
+from .startup import registry
 
 #
 # Ring Current for machine
@@ -11,9 +12,9 @@ ring_curr = EpicsSignalRO('XF:23ID-SR{}I-I', name='ring_curr')
 # EPU Control
 #
 
-epu1 = EPU('XF:23ID-ID{EPU:1', epu_prefix='SR:C23-ID:G1A{EPU:1',
-           ai_prefix='SR:C31-{AI}23', name='epu1')
-epu2 = EPU('XF:23ID-ID{EPU:2', epu_prefix='SR:C23-ID:G1A{EPU:2',
-           ai_prefix='SR:C31-{AI}23-2', name='epu2', labels=['source'])
+epu1 = registry.lazy(EPU, 'XF:23ID-ID{EPU:1', epu_prefix='SR:C23-ID:G1A{EPU:1',
+                     ai_prefix='SR:C31-{AI}23', name='epu1')
+epu2 = registry.lazy(EPU, 'XF:23ID-ID{EPU:2', epu_prefix='SR:C23-ID:G1A{EPU:2',
+                     ai_prefix='SR:C31-{AI}23-2', name='epu2', labels=['source'])
 
 
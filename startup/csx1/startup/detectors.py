@@ -10,6 +10,7 @@ from ophyd import Component as Cpt
 from ophyd import AreaDetector
 from ophyd.sim import NullStatus
 from collections import OrderedDict
+import warnings
 import bluesky.plans as bp
 
 from ..devices.scaler import PrototypeEpicsScaler, StruckSIS3820MCS
@@ -19,17 +20,73 @@ from ..devices.areadetector import (StandardCam, NoStatsCam,
                                     StageOnFirstTrigger,
                                     MonitorStatsCam,
                                     StandardProsilicaWithHDF5, StandardProsilicaWithTIFF, #TODOpmab - added to try to save (inspired from SIX)
-                                    AxisCam) 
+                                    AxisCam, ContinuousAxisCam,
+                                    KindSchema, KindSchemaMixin,
+                                    stats_schema, roi_schema)
 
-from ..startup import db
+from ..startup import db, registry, experiment
 
-def _setup_stats(cam_in):
-    for k in (f'stats{j}' for j in range(1, 6)):
-        cam_in.read_attrs.append(k)
-        getattr(cam_in, k).read_attrs = ['total']
-        getattr(cam_in, k).total.kind = 'hinted'
+# Optional kind schemas that the experiment profile can switch per device;
+# the layout that is always wanted lives on the device classes.
+SETUP_OPTIONS = {'stats': stats_schema(),
+                 'roi': roi_schema()}
 
 
+# for applying by hand to a device that is already built
+def _setup_stats(cam_in):
+    SETUP_OPTIONS['stats'].apply(cam_in)
+
+
+def _setup_roi_config(cam_in):
+    SETUP_OPTIONS['roi'].apply(cam_in)
+
+
+def _declare(factory, *args, name, setup=(), options=(), variants=None,
+             **kwargs):
+    """Declare a detector if the experiment profile asks for it.
+
+    ``setup`` always runs on the built device; ``options`` are the names in
+    SETUP_OPTIONS whose kind schemas are applied when the device is built,
+    unless the profile lists others for this device.  ``variants`` maps
+    further option names to other classes for the same detector (another
+    trigger mode, say); the profile may list one of them.  Devices left out
+    of the profile become a DisabledDevice instead.
+    """
+    if not experiment.wants(name):
+        return registry.disable(name, experiment.reason)
+    variants = variants or {}
+    schema = KindSchema()
+    chosen = []
+    for opt in experiment.options(name, options):
+        if opt in variants:
+            chosen.append(opt)
+            continue
+        if opt not in SETUP_OPTIONS:
+            raise ValueError(f'Experiment profile {experiment.name!r} '
+                             f'({experiment.path}) asks for option {opt!r} for '
+                             f'{name}; known options are '
+                             f'{sorted(SETUP_OPTIONS) + sorted(variants)}.')
+        schema = schema + SETUP_OPTIONS[opt]
+    if len(chosen) > 1:
+        raise ValueError(f'Experiment profile {experiment.name!r} '
+                         f'({experiment.path}) asks for {chosen} for {name}; '
+                         f'pick one of them.')
+    if chosen:
+        factory = variants[chosen[0]]
+    if schema:
+        if not issubclass(factory, KindSchemaMixin):
+            raise ValueError(f'{name} ({factory.__name__}) does not take '
+                             f'the options {experiment.options(name, options)}.')
+        kwargs['kind_schema'] = schema
+    return registry.lazy(factory, *args, name=name, setup=setup, **kwargs)
+
+
+# Everything below is declared through the registry: the devices (and their
+# PVs) are only built the first time a plan or the user touches them. Kinds
+# and read_attrs come from the kind schemas of the classes and `options`,
+# anything else that needs the real device goes in `setup` callables.
+# Which of them exist at all is up to the experiment profile, see
+# experiment.yml.
 
 # #TODO delete, it is already in diag6
 # diag6_pid_threshold = EpicsSignal('XF:23ID1-BI{Diag:6-Cam:1}Stats1:CentroidThreshold',
@@ -41,129 +98,86 @@ def _setup_stats(cam_in):
 # Scalers both MCS and Standard
 #
 
-sclr = PrototypeEpicsScaler('XF:23ID1-ES{Sclr:1}', name='sclr')
+# Only the channels in use are connected; sclr.set_active_channels() to change.
+sclr = _declare(PrototypeEpicsScaler, 'XF:23ID1-ES{Sclr:1}', name='sclr',
+                active_channels=range(1, 7), channel_names='sclr_ch{}')
 
-for sig in sclr.channels.component_names:
-    getattr(sclr.channels, sig).name = 'sclr_' + sig.replace('an', '')
-
-mcs = StruckSIS3820MCS('XF:23ID1-ES{Sclr:1}', name='mcs')
+mcs = _declare(StruckSIS3820MCS, 'XF:23ID1-ES{Sclr:1}', name='mcs')
 
 #
 # Diagnostic Prosilica Cameras
 #
 
-cam_diag2 = StandardCam('XF:23ID1-BI{Diag:2-Cam:1}', name='cam_diag2')#TODOpmab optional imagesave w/ stats always
-_setup_stats(cam_diag2) #diamond diagnostic
+cam_diag2 = _declare(StandardCam, 'XF:23ID1-BI{Diag:2-Cam:1}', name='cam_diag2',#TODOpmab optional imagesave w/ stats always
+                     options=['stats']) #diamond diagnostic
 
 ## 20180726 needed to comment due to IOC1 problems
-cam_slt1 = StandardCam('XF:23ID1-BI{Slt:1-Cam:1}', name='cam_slt1')
-_setup_stats(cam_slt1)
+cam_slt1 = _declare(StandardCam, 'XF:23ID1-BI{Slt:1-Cam:1}', name='cam_slt1',
+                    options=['stats'])
 
-cam_diag3 = StandardCam('XF:23ID1-BI{Diag:3-Cam:1}', name='cam_diag3')
-_setup_stats(cam_diag3)
+cam_diag3 = _declare(StandardCam, 'XF:23ID1-BI{Diag:3-Cam:1}', name='cam_diag3',
+                     options=['stats'])
 
-cam_diag6 = MonitorStatsCam('XF:23ID1-BI{Diag:6-Cam:1}', name='cam_diag6') #TODO testing
+cam_diag6 = _declare(MonitorStatsCam, 'XF:23ID1-BI{Diag:6-Cam:1}', name='cam_diag6') #TODO testing
 
 #cam_diag6 = NoStatsCam('XF:23ID1-BI{Diag:6-Cam:1}', name='diag6') #TODO revert above test
 #cam_diag6.stats1.centroid_threshold.kind = :normal' ## maybe can only subscribe diag6? ##TODOrecord_threshold_for_every_scan_and_PV_put_complete
 #cam_diag6.stats1.kind = 'normal'
-cam_diag6_hdf5 = StandardProsilicaWithHDF5('XF:23ID1-BI{Diag:6-Cam:1}', name='cam_diag6_hdf5') #TODO replace with DSSI project
+cam_diag6_hdf5 = _declare(StandardProsilicaWithHDF5, 'XF:23ID1-BI{Diag:6-Cam:1}', name='cam_diag6_hdf5') #TODO replace with DSSI project
 #_setup_stats_cen(cam_diag6_hdf5)
 ## 20180726 needed to comment due to IOC1 problems - probably ok now, but not used.
-cam_dif = StandardCam('XF:23ID1-ES{Diag:5-Cam:1}', name='cam_dif')
-cam_dif_hdf5 = StandardProsilicaWithHDF5('XF:23ID1-ES{Diag:5-Cam:1}', name='cam_dif_hdf5')
-_setup_stats(cam_dif)
+cam_dif = _declare(StandardCam, 'XF:23ID1-ES{Diag:5-Cam:1}', name='cam_dif',
+                   options=['stats'])
+cam_dif_hdf5 = _declare(StandardProsilicaWithHDF5, 'XF:23ID1-ES{Diag:5-Cam:1}', name='cam_dif_hdf5',
+                        options=['roi'])
 #_setup_stats_cen(cam_dif_hdf5)
 
-cam_slt3 = StandardCam('XF:23ID1-ES{Dif-Cam:Beam}', name='cam_slt3')
+cam_slt3 = _declare(StandardCam, 'XF:23ID1-ES{Dif-Cam:Beam}', name='cam_slt3',
+                    options=['stats'])
 #cam_slt3_hdf5 = StandardProsilicaWithHDF5('XF:23ID1-ES{Dif-Cam:Beam}', name='cam_slt3_hdf5') #TODO replace with DSSI project
-_setup_stats(cam_slt3)
 #_setup_stats_cen(cam_slt3_hdf5)
 
-# TODO: Add this parameter when switch from `SingleTrigger` to `ContinuousAcquisitionTrigger``: plugin_name='hdf5'
-axis1 = AxisCam("XF:23ID1-ES{AXIS}", name='axis1')
-_setup_stats(axis1)
-### more roi metadata at the end
+# `continuous` in the profile leaves the camera acquiring and takes the
+# frames of each trigger out of one HDF5 file per run
+axis1 = _declare(AxisCam, "XF:23ID1-ES{AXIS}", name='axis1',
+                 options=['stats', 'roi'],
+                 variants={'continuous': ContinuousAxisCam})
 
 # Setup on 2018/03/16 for correlating fCCD and sample position - worked 
 # DON'T NEED STATS to take pictures of sample/optics
 #dif_cam1 = StandardCam('XF:23ID1-ES{Dif-Cam:1}', name='dif_cam1' )
 #_setup_stats(dif_cam2) #comment to disable
-cam_dif_micro = StandardProsilicaWithTIFF('XF:23ID1-ES{Dif-Cam:1}', name='cam_dif_micro')
-cam_dif_top = StandardProsilicaWithTIFF('XF:23ID1-ES{Dif-Cam:2}', name='cam_dif_top')
-cam_dif_side = StandardProsilicaWithTIFF('XF:23ID1-ES{Dif-Cam:3}', name='cam_dif_side')##TODO think how to fix with trans plugin
+cam_dif_micro = _declare(StandardProsilicaWithTIFF, 'XF:23ID1-ES{Dif-Cam:1}', name='cam_dif_micro')
+cam_dif_top = _declare(StandardProsilicaWithTIFF, 'XF:23ID1-ES{Dif-Cam:2}', name='cam_dif_top')
+cam_dif_side = _declare(StandardProsilicaWithTIFF, 'XF:23ID1-ES{Dif-Cam:3}', name='cam_dif_side')##TODO think how to fix with trans plugin
 
 ## 20201219 - Machine studies for source characterization #TODO save also images like real detector
-cam_fs = StandardCam('XF:23IDA-BI:1{FS:1-Cam:1}', name='cam_fs') #TODOpmab optional imagesave w/ stats always
+cam_fs = _declare(StandardCam, 'XF:23IDA-BI:1{FS:1-Cam:1}', name='cam_fs') #TODOpmab optional imagesave w/ stats always
 
 
-#cam_pa= StandardCam('XF:23ID1-BI{Diag:7-Cam:1}', name='cam_pa') #TODOpmab optional imagesave w/ stats always
-#_setup_stats(cam_pa)
+cam_pa = _declare(StandardCam, 'XF:23ID1-BI{Diag:7-Cam:1}', name='cam_pa', #TODOpmab optional imagesave w/ stats always
+                  options=['stats'])
 
-### SWITCH AS NEEDED per experiment
+### SWITCH AS NEEDED per experiment in experiment.yml
 ### OPT1
-#cam_bs = StandardCam('XF:23ID1-BI{Diag:8-Cam:1}', name='cam_bs') #TODOpmab optional imagesave w/ stats always
-#_setup_stats(cam_bs)
-#cam_bs_hdf5 = StandardProsilicaWithHDF5('XF:23ID1-BI{Diag:8-Cam:1}', name='cam_bs_hdf5') #TODO replace with DSSI project
-#_setup_stats(cam_bs)
-#_setup_stats(cam_bs_hdf5)
-
-
-# FastCCD
-
-fccd = StageOnFirstTrigger('XF:23ID1-ES{FCCD}',
-#fccd = ProductionCamTriggered('XF:23ID1-ES{FCCD}',
-                              dg1_prefix='XF:23ID1-ES{Dly:1',
-                              dg2_prefix='XF:23ID1-ES{Dly:2',
-                              mcs_prefix='XF:23ID1-ES{Sclr:1}',
-                              name='fccd')
-fccd.read_attrs = ['hdf5','mcs.wfrm']
-fccd.hdf5.read_attrs = []
-#fccd.hdf5._reg = db.reg
-configuration_attrs_list = ['cam.acquire_time',
-                            'cam.acquire_period',
-                            'cam.image_mode',
-                            'cam.num_images',
-                            'cam.sdk_version',
-                            'cam.firmware_version',
-                            'cam.overscan_cols',
-                            'cam.fcric_gain',
-                            'cam.fcric_clamp',
-                            'dg1', 'dg2',
-                            'dg2.A', 'dg2.B',
-                            'dg2.C', 'dg2.D',
-                            'dg2.E', 'dg2.F',
-                            'dg2.G', 'dg2.H',
-                            'dg1.A', 'dg1.B',
-                            'dg1.C', 'dg1.D',
-                            'dg1.E', 'dg1.F',
-                            'dg1.G', 'dg1.H',
-                            'fccd1.enable_bgnd',
-                            'fccd1.enable_gain',
-                            'fccd1.enable_size',
-                            'fccd1.rows',
-                            'fccd1.row_offset',
-                            'fccd1.overscan_cols',
-                            ]
-
-
-roi_params = ['.min_xyz', '.min_xyz.min_y', '.min_xyz.min_x',
-              '.size', '.size.y', '.size.x', '.name_']
-configuration_attrs_list.extend(['roi' + str(i) + string for i in range(1,5) for string in roi_params])
-
-##TODO make roi config attrs into generic function like _setup_stats so all areadetectors can have roi coordinates
-for attr in configuration_attrs_list:
-    getattr(fccd, attr).kind='config'
-fccd.configuration_attrs.extend(['roi1', 'roi2', 'roi3','roi4'])
-_setup_stats(fccd)
-
-
-configuration_attrs_list = []                        
-configuration_attrs_list.extend(['roi' + str(i) + string for i in range(1,5) for string in roi_params])
-for attr in configuration_attrs_list:
-    getattr(cam_dif_hdf5, attr).kind='config'
-cam_dif_hdf5.configuration_attrs.extend(['roi1', 'roi2', 'roi3','roi4'])
-
-for attr in configuration_attrs_list:
-    getattr(axis1, attr).kind='config'
-axis1.configuration_attrs.extend(['roi1', 'roi2', 'roi3','roi4'])
\ No newline at end of file
+cam_bs = _declare(StandardCam, 'XF:23ID1-BI{Diag:8-Cam:1}', name='cam_bs', #TODOpmab optional imagesave w/ stats always
+                  options=['stats'])
+cam_bs_hdf5 = _declare(StandardProsilicaWithHDF5, 'XF:23ID1-BI{Diag:8-Cam:1}', name='cam_bs_hdf5', #TODO replace with DSSI project
+                       options=['stats'])
+
+
+# FastCCD, see ProductionCamTriggered.kind_schema for its layout
+
+fccd = _declare(StageOnFirstTrigger, 'XF:23ID1-ES{FCCD}',
+#fccd = _declare(ProductionCamTriggered, 'XF:23ID1-ES{FCCD}',
+                dg1_prefix='XF:23ID1-ES{Dly:1',
+                dg2_prefix='XF:23ID1-ES{Dly:2',
+                mcs_prefix='XF:23ID1-ES{Sclr:1}',
+                name='fccd',
+                options=['roi', 'stats'])
+
+
+for _name in experiment.devices:
+    if _name not in registry and not registry.is_disabled(_name):
+        warnings.warn(f'Experiment profile {experiment.name!r} ({experiment.path}) '
+                      f'lists {_name!r}, which is not a known detector; ignoring it.')
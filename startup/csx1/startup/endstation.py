@@ -9,7 +9,7 @@ from ..devices.optics import (SamplePosVirtualMotor, Cryoangle,
 
 from ..devices.lakeshore import Lakeshore336
 from ..devices.eps import EPSTwoStateDevice
-from .tardis import tardis
+from .tardis import theta, delta, gamma
 
 from ..devices.devices import PMACKiller
 
@@ -21,11 +21,7 @@ tardis_gv = EPSTwoStateDevice('XF:23ID1-VA{Diag:06-GV:1}',
                           name='tardis_gv') 
 
 
-# Diffo angles
-
-delta = tardis.delta
-gamma = tardis.gamma
-theta = tardis.theta
+# Diffo angles: theta, delta and gamma come from .tardis
 
 
 
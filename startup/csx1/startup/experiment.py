@@ -0,0 +1,75 @@
+"""Per-experiment choice of which detectors and cameras get loaded.
+
+``detectors.py`` declares every detector and camera the beamline has; the
+experiment profile (a YAML file) picks the ones to load and which optional
+setups (stats, ROI configuration) they get.  Devices that are not picked are
+not declared at all, so they never build, never open CA channels and never
+hold monitors; their names point to a placeholder that explains why they are
+missing.
+
+The profile is read from ``$CSX_EXPERIMENT_PROFILE`` if set, else from
+``/nsls2/data/csx/shared/config/experiment.yml``, else the default that
+ships next to this file (``experiment.yml``).  See that file for the format.
+"""
+import os
+
+import yaml
+
+
+SHARED_PROFILE = '/nsls2/data/csx/shared/config/experiment.yml'
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'experiment.yml')
+
+
+class ExperimentProfile:
+    """Which devices to load, and with which optional setups.
+
+    Parameters
+    ----------
+    name : str
+        Shown in the error raised when a disabled device is used.
+    devices : dict
+        Device name -> list of setup option names, ``None`` for the
+        defaults of the device, or ``False`` to not load it.
+    path : str, optional
+        Where the profile was read from.
+    """
+    def __init__(self, name, devices, path=None):
+        self.name = name
+        self.devices = dict(devices or {})
+        self.path = path
+
+    def __repr__(self):
+        return f'ExperimentProfile({self.name!r}, path={self.path!r})'
+
+    def wants(self, name):
+        return self.devices.get(name, False) is not False
+
+    def options(self, name, default=()):
+        options = self.devices.get(name)
+        if options is None or options is True:
+            return list(default)
+        return list(options)
+
+    @property
+    def reason(self):
+        where = f' ({self.path})' if self.path else ''
+        return (f"not part of experiment profile {self.name!r}{where}; "
+                f"add it under 'devices:' and restart bsui")
+
+
+def load_experiment(path=None):
+    """Read an experiment profile (see the module docstring for the lookup).
+
+    Returns
+    -------
+    ExperimentProfile
+    """
+    if path is None:
+        path = os.environ.get('CSX_EXPERIMENT_PROFILE')
+    if path is None:
+        path = SHARED_PROFILE if os.path.exists(SHARED_PROFILE) else DEFAULT_PROFILE
+    with open(path) as f:
+        contents = yaml.safe_load(f) or {}
+    return ExperimentProfile(contents.get('name', os.path.basename(path)),
+                             contents.get('devices'), path=path)
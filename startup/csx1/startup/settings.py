@@ -1,6 +1,6 @@
 from bluesky.magics import BlueskyMagics
 
-from .startup import sd
+from .startup import sd, registry
 from .detectors import *
 from .endstation import *
 from .accelerator import *
@@ -20,23 +20,47 @@ sd.baseline = [theta, delta, gamma, muR,
                m1a, 
                m3a,
                #nanop, tardis,
-               tardis,
                stemp, pgm,
                inout, es_diag1_y, diag6_pid,]# diag6.stats1.centroid_threshold ] ###TODOrecord_threshold_for_every_scan_and_PV_put_complete OR probably should link to diag6_pid as RO
 
+# The tardis (h, k, l and the hkl calc) joins the baseline once something
+# has used it; sessions that never do reciprocal space never load hkl.
+# theta, delta and gamma are the tardis' own axes (see tardis.py), so from
+# then on they are read as part of it: the tardis takes their place in the
+# list rather than reading them twice (their data keys would collide).
+@registry.configure('tardis')
+def _baseline_tardis(tardis):
+    axes = (tardis.theta, tardis.delta, tardis.gamma)
+    sd.baseline[:] = [dev for dev in sd.baseline
+                      if not any(dev is axis for axis in axes)]
+    if tardis not in sd.baseline:
+        sd.baseline.append(tardis)
+
+# Devices that are slow to read and rarely change can go in a slow tier that
+# is only read every sd.slow_every runs / sd.slow_interval seconds; print
+# sd.audit() to see what each baseline device costs.
+# sd.slow_baseline = [pgm]
+
+# Long series of short scans: only record what changed against a full
+# baseline (see csx1/devices/baseline.py, csx1.analysis.baseline.full_baseline)
+# sd.delta = True
+
 #bec.disable_baseline() #no print to CLI, just save to datastore
 
 #axis1.cam.temperature_actual.kind = 'hinted'
 #sd.baseline.extend([axis1.cam.temperature_actual]) ## TODO we need soemthing differnt
 
-sclr.names.read_attrs=['name1','name2','name3','name4','name5','name6']  # TODO  WHAT IS THIS??? - Dan Allan
-sclr.channels.read_attrs=['chan1','chan2','chan3','chan4','chan5','chan6']
-# Old-style hints config is replaced by the new 'kind' feature
-# sclr.hints = {'fields': ['sclr_ch2', 'sclr_ch3', 'sclr_ch6']}
-for i in [2, 3, 4, 5]:
-    getattr(sclr.channels, f'chan{i}').kind = 'hinted'
-    # getattr(sclr.channels, f'chan{i}').kind = 'normal' will remove the
-    # hinted fields from LivePlot and LiveTable.
+# The detectors are built on first use, so their settings are applied then.
+@registry.configure('sclr')
+def _configure_sclr(sclr):
+    # Channels 1-6 are the active ones (see detectors.py), which also puts
+    # their names, presets and gates in the configuration.
+    # Old-style hints config is replaced by the new 'kind' feature
+    # sclr.hints = {'fields': ['sclr_ch2', 'sclr_ch3', 'sclr_ch6']}
+    for i in [2, 3, 4, 5]:
+        getattr(sclr.channels, f'chan{i}').kind = 'hinted'
+        # getattr(sclr.channels, f'chan{i}').kind = 'normal' will remove the
+        # hinted fields from LivePlot and LiveTable.
 
 
 
@@ -44,15 +68,19 @@ def relabel_fig(fig, new_label):
     fig.set_label(new_label)
     fig.canvas.manager.set_window_title(fig.get_label())
 
-# fccd.hints = {'fields': ['fccd_stats1_total']}
-for i in [1, 2, 3, 4, 5]:
-    getattr(fccd, f'stats{i}').total.kind = 'hinted'
-# Silence the channels we do not use (7-32)
-fccd.mcs.read_attrs = fccd.mcs.read_attrs[0:7]
+@registry.configure('fccd')
+def _configure_fccd(fccd):
+    # fccd.hints = {'fields': ['fccd_stats1_total']}
+    for i in [1, 2, 3, 4, 5]:
+        getattr(fccd, f'stats{i}').total.kind = 'hinted'
+    # Silence the channels we do not use (7-32); they are not even connected
+    fccd.mcs.set_active_channels(range(1, 7))
 
-# cam_dif.hints = {'fields' : ['cam_dif_stats3_total','cam_dif_stats1_total']}
-for i in [1, 3]:
-    getattr(cam_dif, f'stats{i}').total.kind = 'hinted'
+@registry.configure('cam_dif')
+def _configure_cam_dif(cam_dif):
+    # cam_dif.hints = {'fields' : ['cam_dif_stats3_total','cam_dif_stats1_total']}
+    for i in [1, 3]:
+        getattr(cam_dif, f'stats{i}').total.kind = 'hinted'
 
 ## 20180726 needed to comment due to IOC1 problems
 #cube_beam.hints = {'fields': ['cube_beam_stats2_total', 'cube_beam_stats1_total']}
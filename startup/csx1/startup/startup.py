@@ -18,4 +18,20 @@ from IPython import get_ipython
 ip = get_ipython()
 RE = ip.user_ns['RE']
 db = ip.user_ns['db']
-sd = ip.user_ns['sd']
+
+# Handlers for the files our own devices write, see csx1/analysis/handlers.py
+from ..analysis.handlers import register_handlers
+register_handlers(db)
+
+# Baseline readings come from CA monitors instead of a round of CA gets at
+# the start and end of every run, see csx1/devices/baseline.py.
+from ..devices.baseline import MonitoredBaseline
+sd = ip.user_ns['sd'] = MonitoredBaseline.replace(RE, ip.user_ns['sd'])
+
+# Devices declared through the registry are only built on first use.
+from ..devices.registry import DeviceRegistry
+registry = DeviceRegistry()
+
+# Which detectors and cameras to load at all, see experiment.yml.
+from .experiment import load_experiment
+experiment = load_experiment()
@@ -1,13 +1,6 @@
-from ophyd import Component as Cpt
-from ophyd import (PseudoSingle, EpicsMotor, SoftPositioner, Signal)
-import gi
-gi.require_version('Hkl', '5.0')
-try:
-    from hkl.diffract import E6C  #this works for mu=0
-except ImportError:
-    # The class was moved to hkl.geometries module in recent hklpy v0.3.16.
-    from hkl.geometries import E6C
-from ophyd.pseudopos import (pseudo_position_argument, real_position_argument)
+from ophyd import EpicsMotor
+
+from .startup import registry
 
 # Add MuR and MuT to bluesky list of motors and detectors.
 muR = EpicsMotor('XF:23ID1-ES{Dif-Ax:MuR}Mtr', name='muR')
@@ -15,111 +8,100 @@ muR = EpicsMotor('XF:23ID1-ES{Dif-Ax:MuR}Mtr', name='muR')
 # muR = EpicsSignal('XF:23ID1-ES{Dif-Ax:MuR}Mtr.RBV', name='muR')
 muT = EpicsMotor('XF:23ID1-ES{Dif-Ax:MuT}Mtr', name='muT')
 
+# The diffractometer circles are plain motors, usable right away. When the
+# tardis is built it takes these same objects as its theta, delta and gamma
+# (see AxisCpt in ..devices.tardis), so there is one motor per axis and
+# `theta is tardis.theta`; hence the tardis_* names.
+theta = EpicsMotor('XF:23ID1-ES{Dif-Ax:Th}Mtr', name='tardis_theta', labels=['tardis'])
+delta = EpicsMotor('XF:23ID1-ES{Dif-Ax:Del}Mtr', name='tardis_delta', labels=['tardis'])
+gamma = EpicsMotor('XF:23ID1-ES{Dif-Ax:Gam}Mtr', name='tardis_gamma', labels=['tardis'])
 
-# TODO: fix upstream!!
-class NullMotor(SoftPositioner):
-    @property
-    def connected(self):
-        return True
+for _mtr in (theta, delta, gamma):
+    _mtr.user_offset.kind = 'config' #hot fix https://github.com/bluesky/bluesky/issues/1665
 
 
-class Tardis(E6C):  #this works for mu=0
-    h = Cpt(PseudoSingle, '', labels=['tardis'])
-    k = Cpt(PseudoSingle, '', labels=['tardis'])
-    l = Cpt(PseudoSingle, '', labels=['tardis'])
+# The Tardis itself (hkl, gi and the calc engine) is only built when
+# tardis.h/k/l, tardis.calc, tardis.position ... or an HKL plan first needs
+# it, see ..devices.tardis for the class.
 
-    theta = Cpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Th}Mtr', labels=['tardis'])
-    mu = Cpt(NullMotor, labels=['tardis'])
+def _make_tardis(*args, **kwargs):
+    from ..devices.tardis import Tardis
+    return Tardis(*args, **kwargs)
 
-    chi =   Cpt(NullMotor, labels=['tardis'])
-    phi =   Cpt(NullMotor, labels=['tardis'])
-    delta = Cpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Del}Mtr', labels=['tardis'])
-    gamma = Cpt(EpicsMotor, 'XF:23ID1-ES{Dif-Ax:Gam}Mtr', labels=['tardis'])
 
+def Lattice(*args, **kwargs):
+    "hkl.util.Lattice, imported on first use."
+    from hkl.util import Lattice
+    return Lattice(*args, **kwargs)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
 
-        # prime the 3 null-motors with initial values
-        # otherwise, position == None --> describe, etc gets borked
-        self.chi.move(0.0)
-        self.phi.move(0.0)
+# re-map Tardis' axis names onto what an E6C expects
+name_map = {'mu': 'theta', 'omega': 'mu', 'chi': 'chi', 'phi': 'phi', 'gamma': 'delta', 'delta': 'gamma'}
 
-        # we have to use a motor for omega to keep hkl happy,
-        # but want to keep omega as read-only and to follow muR
-        def muR_updater(value, **kwargs):
-            self.mu.move(value)
 
-        muR.subscribe(muR_updater)
+def _setup_tardis(tardis):
+    # FIXME: hack to get around what should have been done at init of tardis_calc instance
+    # tardis_calc._lock_engine = True
 
-    @pseudo_position_argument
-    def set(self, position):
-        return super().set([float(_) for _ in position])
+    tardis.theta.user_offset.kind = 'config' #hot fix https://github.com/bluesky/bluesky/issues/1665
+    tardis.delta.user_offset.kind = 'config'
+    tardis.gamma.user_offset.kind = 'config'
 
-# FIXME: hack to get around what should have been done at init of tardis_calc instance
-# tardis_calc._lock_engine = True
+    tardis.reflections.kind = "omitted"
 
-# tardis = Tardis('', name='tardis', calc_inst=tardis_calc)
-tardis = Tardis('', name='tardis')
+    tardis.calc.physical_axis_names = name_map
 
-tardis.theta.user_offset.kind = 'config' #hot fix https://github.com/bluesky/bluesky/issues/1665
-tardis.delta.user_offset.kind = 'config'
-tardis.gamma.user_offset.kind = 'config'
+    tardis.calc.engine.mode = 'lifting_detector_mu'  #THis is for E6C, it exists for petra3_09..., but not loaded
 
-tardis.reflections.kind = "omitted"
+    # from this point, we can configure the Tardis instance
 
-# re-map Tardis' axis names onto what an E6C expects
-name_map = {'mu': 'theta', 'omega': 'mu', 'chi': 'chi', 'phi': 'phi', 'gamma': 'delta', 'delta': 'gamma'}
+    ## lengths are in Angstrom, angles are in degrees
+    ##lattice = Lattice(a=9.069, b=9.069, c=10.390, alpha=90.0, beta=90.0, gamma=120.0)
+    #
+    ## add the sample to the calculation engine
+    ##tardis.calc.new_sample('esrf_sample', lattice=lattice)
+    #
+    ## we can alternatively set the energy on the Tardis instance
+    ##tardis.calc.wavelength = 1.61198 # angstroms
 
+    # apply some constraints
 
-tardis.calc.physical_axis_names = name_map
+    # Theta
+    tardis.calc['theta'].limits = (-181, 181)
+    tardis.calc['theta'].value = 0
+    tardis.calc['theta'].fit = True
 
-tardis.calc.engine.mode = 'lifting_detector_mu'  #THis is for E6C, it exists for petra3_09..., but not loaded
+    # we don't have it. Fix to 0
+    tardis.calc['phi'].limits = (0, 0)
+    tardis.calc['phi'].value = 0
+    tardis.calc['phi'].fit = False
 
-# from this point, we can configure the Tardis instance
-from hkl.util import Lattice
+    # we don't have it. Fix to 0
+    tardis.calc['chi'].limits = (0, 0)
+    tardis.calc['chi'].value = 0
+    tardis.calc['chi'].fit = False
 
-## lengths are in Angstrom, angles are in degrees
-##lattice = Lattice(a=9.069, b=9.069, c=10.390, alpha=90.0, beta=90.0, gamma=120.0)
-#
-## add the sample to the calculation engine
-##tardis.calc.new_sample('esrf_sample', lattice=lattice)
-#
-## we can alternatively set the energy on the Tardis instance
-##tardis.calc.wavelength = 1.61198 # angstroms
-
-# apply some constraints
-
-# Theta
-tardis.calc['theta'].limits = (-181, 181)
-tardis.calc['theta'].value = 0
-tardis.calc['theta'].fit = True
-
-# we don't have it. Fix to 0
-tardis.calc['phi'].limits = (0, 0)
-tardis.calc['phi'].value = 0
-tardis.calc['phi'].fit = False
-
-# we don't have it. Fix to 0
-tardis.calc['chi'].limits = (0, 0)
-tardis.calc['chi'].value = 0
-tardis.calc['chi'].fit = False
-
-# we don't have it!! Fix to 0
-tardis.calc['mu'].limits = (0, 0)
-tardis.calc['mu'].value = 0#tardis.omega.position.real
-tardis.calc['mu'].fit = False
-
-# Attention naming convention inverted at the detector stages!
-# delta
-tardis.calc['delta'].limits = (-5, 180)
-tardis.calc['delta'].value = 0
-tardis.calc['delta'].fit = True
-
-# gamma
-tardis.calc['gamma'].limits = (-5, 180)
-tardis.calc['gamma'].value = 0
-tardis.calc['gamma'].fit = True
+    # we don't have it!! Fix to 0
+    tardis.calc['mu'].limits = (0, 0)
+    tardis.calc['mu'].value = 0#tardis.omega.position.real
+    tardis.calc['mu'].fit = False
+
+    # Attention naming convention inverted at the detector stages!
+    # delta
+    tardis.calc['delta'].limits = (-5, 180)
+    tardis.calc['delta'].value = 0
+    tardis.calc['delta'].fit = True
+
+    # gamma
+    tardis.calc['gamma'].limits = (-5, 180)
+    tardis.calc['gamma'].value = 0
+    tardis.calc['gamma'].fit = True
+
+
+# tardis = Tardis('', name='tardis', calc_inst=tardis_calc)
+tardis = registry.lazy(_make_tardis, '', name='tardis', muR=muR,
+                       axes={'theta': theta, 'delta': delta, 'gamma': gamma},
+                       setup=[_setup_tardis])
 
 ## add two, known reflections and compute UB
 #r1 = tardis.calc.sample.add_reflection(3, 3, 0,